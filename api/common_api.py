@@ -6,13 +6,13 @@ from api.common_response import *
 from config import current_version, shared
 import logging
 import time
-from module.firmware import get_firmware_infos
 
 logger = logging.getLogger(__name__)
 
 
 @eel.expose
 def get_available_firmware_infos():
+    from module.firmware import get_firmware_infos
     try:
         return success_response(get_firmware_infos())
     except Exception as e:
@@ -69,9 +69,11 @@ def open_url_in_default_browser(url):
 def update_setting(setting: Dict[str, object]):
     from config import config, update_setting
     update_setting(setting)
-    from module.network import session, get_durable_cache_session, get_proxies
-    session.proxies.update(get_proxies())
-    get_durable_cache_session().proxies.update(get_proxies())
+    from module.network import session, get_durable_cache_session, get_proxies, invalidate_proxy_cache
+    invalidate_proxy_cache()
+    proxies = get_proxies()
+    session.proxies.update(proxies)
+    get_durable_cache_session().proxies.update(proxies)
     return success_response(config.to_dict())
 
 
@@ -149,7 +151,9 @@ def update_window_size(width: int, height: int):
 @generic_api
 def get_storage():
     from storage import storage
-    return storage.to_dict()
+    res = storage.to_dict()
+    res.pop('release_cache', None)
+    return res
 
 
 @generic_api
@@ -10,7 +10,13 @@ import eel
 logger = logging.getLogger(__name__)
 
 
+# shared by all empty success responses, callers must not modify it
+_EMPTY_SUCCESS = {'code': 0, 'data': None, 'msg': None}
+
+
 def success_response(data=None, msg=None):
+    if data is None and msg is None:
+        return _EMPTY_SUCCESS
     return {'code': 0, 'data': data, 'msg': msg}
 
 
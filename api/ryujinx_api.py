@@ -1,6 +1,5 @@
 import eel
 from api.common_response import success_response, exception_response, error_response
-from repository.ryujinx import get_all_ryujinx_release_infos
 from config import config
 import logging
 
@@ -43,8 +42,14 @@ def update_ryujinx_path(folder: str):
 @eel.expose
 def get_ryujinx_release_infos():
     try:
-        print(config.ryujinx.branch)
-        return success_response(get_all_ryujinx_release_infos(config.ryujinx.branch))
+        from repository.batch import fetch_all_release_infos_parallel
+        from repository.ryujinx import get_all_ryujinx_release_infos
+        branch = config.ryujinx.branch
+        # load both branches at once so switching branch hits the release cache
+        infos = fetch_all_release_infos_parallel(['mainline', 'canary'])
+        if branch not in infos:
+            return success_response(get_all_ryujinx_release_infos(branch))
+        return success_response(infos[branch])
     except Exception as e:
         return exception_response(e)
 
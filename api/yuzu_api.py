@@ -1,7 +1,6 @@
 import eel
 from api.common_response import success_response, exception_response, error_response
-from repository.yuzu import get_all_yuzu_release_infos
-from config import config, dump_config
+from config import config, dump_config, get_yuzu_config_dict
 import logging
 
 logger = logging.getLogger(__name__)
@@ -16,7 +15,7 @@ def open_yuzu_keys_folder():
 
 @eel.expose
 def get_yuzu_config():
-    return config.yuzu.to_dict()
+    return get_yuzu_config_dict()
 
 
 @eel.expose
@@ -89,7 +88,7 @@ def switch_yuzu_branch():
     logger.info(f'switch yuzu branch to {target_branch}')
     config.yuzu.branch = target_branch
     dump_config()
-    return config.yuzu.to_dict()
+    return get_yuzu_config_dict()
 
 
 @eel.expose
@@ -0,0 +1,5 @@
+# must be imported before anything that imports ssl or socket
+import gevent.monkey
+
+gevent.monkey.patch_ssl()
+gevent.monkey.patch_socket()
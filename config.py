@@ -48,6 +48,7 @@ class YuzuConfig:
     yuzu_version: Optional[str] = None
     yuzu_firmware: Optional[str] = None
     branch: Optional[str] = 'ea'
+    installed_sha: Optional[str] = None
 
 
 @dataclass_json
@@ -131,12 +132,30 @@ if not config:
 config.yuzu.branch = 'ea'
 
 
+# bumped on every dump_config, all config changes are followed by a dump
+_config_version = 0
+_yuzu_dict_cache = {'key': None, 'val': None}
+
+
 def dump_config():
+    global _config_version
+    _config_version += 1
     logger.info(f'saving config to {config_path.absolute()}')
     with open(config_path, 'w', encoding='utf-8') as f:
         f.write(config.to_json(ensure_ascii=False, indent=2))
 
 
+def get_yuzu_config_dict():
+    """
+    config.yuzu.to_dict(), rebuilt only after dump_config or when config.yuzu is replaced
+    """
+    key = (id(config.yuzu), _config_version)
+    if _yuzu_dict_cache['key'] != key:
+        _yuzu_dict_cache['val'] = config.yuzu.to_dict()
+        _yuzu_dict_cache['key'] = key
+    return _yuzu_dict_cache['val']
+
+
 def update_last_open_emu_page(page: str):
     if page == 'ryujinx':
         config.setting.ui.lastOpenEmuPage = 'ryujinx'
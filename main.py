@@ -1,10 +1,6 @@
+import bootstrap
 import argparse
 import logging
-import gevent.monkey
-
-gevent.monkey.patch_ssl()
-gevent.monkey.patch_socket()
-
 import sys
 from config import config, dump_config
 from utils.webview2 import can_use_webview
@@ -51,6 +47,11 @@ def create_parser():
         choices=['auto', 'webview', 'browser', 'chrome', 'edge', 'user default'],
         help="切换 ui 启动方式",
     )
+    parser.add_argument(
+        "--pretty-storage",
+        action='store_true',
+        help="以便于阅读的格式重写 storage.json",
+    )
     parser.add_argument(
         "--no-sentry",
         action='store_true',
@@ -70,6 +71,11 @@ def main():
         dump_config()
         return 0
 
+    if args.pretty_storage:
+        from storage import dump_storage
+        dump_storage(indent=2)
+        return 0
+
     from module.external.bat_scripts import create_scripts
     create_scripts()
 
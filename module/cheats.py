@@ -3,7 +3,7 @@ import shutil
 import string
 from pathlib import Path
 from typing import List, Dict
-from module.network import get_durable_cache_session
+from module.network import get_durable_cache_session, json_loads
 import logging
 import time
 from utils.string_util import auto_decode
@@ -25,7 +25,7 @@ def get_game_data():
         resp = get_durable_cache_session().get(
             'https://ghproxy.net/https://raw.githubusercontent.com/triwinds/ns-emu-tools/main/game_data.json',
             timeout=5)
-        return resp.json()
+        return json_loads(resp.content)
     except Exception as e:
         logger.warning(f'fail to load game data, ex: {e}')
     return res
@@ -218,7 +218,7 @@ def open_cheat_mod_folder(folder_path: str):
     import subprocess
     parent_folder = folder.parent
     logger.info(f'open folder [{parent_folder}] in explorer')
-    subprocess.Popen(f'explorer "{str(parent_folder.absolute())}"')
+    subprocess.Popen(['explorer', str(parent_folder.absolute())])
 
 
 def main():
@@ -8,19 +8,36 @@ from module.network import get_finial_url
 logger = logging.getLogger(__name__)
 
 
-def check_and_install_msvc():
+def get_msvc_status():
+    """
+    Check the installed msvc runtime, only reads files and the registry, no notify / download.
+    :return: 'missing', 'outdated' or 'ok'
+    """
     windir = Path(os.environ['windir'])
-    if windir.joinpath(r'System32\msvcp140_atomic_wait.dll').exists():
-        from utils.common import find_installed_software, is_newer_version
-        software_list = find_installed_software(r'Microsoft Visual C\+\+ .+ Redistributable')
-        if not software_list:
-            logger.info(f'msvc already installed, but version not found in registry.')
-            return
-        logger.debug(f'Installed msvc: {software_list}')
-        if not any(is_newer_version('14.38', s['version']) for s in software_list):
-            logger.info(f'show update msvc notification.')
-            send_notify('如果在启动模拟器时提示 [无法定位程序输入点]，可以试试更新你的 msvc')
-            send_notify('下载链接：https://aka.ms/vs/17/release/VC_redist.x64.exe')
+    if not windir.joinpath(r'System32\msvcp140_atomic_wait.dll').exists():
+        return 'missing'
+    from utils.common import find_installed_software, is_newer_version
+    software_list = find_installed_software(r'Microsoft Visual C\+\+ .+ Redistributable')
+    if not software_list:
+        logger.info(f'msvc already installed, but version not found in registry.')
+        return 'ok'
+    logger.debug(f'Installed msvc: {software_list}')
+    if not any(is_newer_version('14.38', s['version']) for s in software_list):
+        return 'outdated'
+    return 'ok'
+
+
+def check_and_install_msvc(status=None):
+    """
+    :param status: result of get_msvc_status if it has been checked already
+    """
+    if status is None:
+        status = get_msvc_status()
+    if status == 'outdated':
+        logger.info(f'show update msvc notification.')
+        send_notify('如果在启动模拟器时提示 [无法定位程序输入点]，可以试试更新你的 msvc')
+        send_notify('下载链接：https://aka.ms/vs/17/release/VC_redist.x64.exe')
+    if status != 'missing':
         return
     from module.downloader import download
     send_notify('开始下载 msvc 安装包...')
@@ -30,7 +47,15 @@ def check_and_install_msvc():
     send_notify('安装 msvc...')
     logger.info('install msvc...')
     process = subprocess.Popen([install_file.path])
-    # process.wait()
+    import threading
+    threading.Thread(target=_clear_installed_software_after_exit, args=(process,), daemon=True).start()
+
+
+def _clear_installed_software_after_exit(process):
+    # the installer runs on its own, the registry only changes once it has finished
+    process.wait()
+    from utils.common import get_installed_software
+    get_installed_software.cache_clear()
 
 
 def delete_path(path: str):
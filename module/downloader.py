@@ -1,4 +1,5 @@
 import subprocess
+import threading
 import time
 from typing import Optional
 import logging
@@ -13,6 +14,10 @@ from tqdm import tqdm
 
 aria2: Optional[aria2p.API] = None
 aria2_process: Optional[subprocess.Popen] = None
+aria2_init_lock = threading.Lock()
+_no_proxy_lock = threading.Lock()
+_no_proxy_users = 0
+_origin_no_proxy = None
 download_path = Path('./download/')
 aria2_path = Path(os.path.realpath(os.path.dirname(__file__))).joinpath('aria2c.exe')
 if not download_path.exists():
@@ -89,14 +94,15 @@ def init_aria2():
     global aria2
     global aria2_process
     ex = None
-    for _ in range(2):
-        try:
-            _init_aria2()
-            return
-        except Exception as e:
-            ex = e
-            logger.info(f'Fail in start aria2 daemon, trying to restart...')
-            aria2 = aria2_process = None
+    with aria2_init_lock:
+        for _ in range(2):
+            try:
+                _init_aria2()
+                return
+            except Exception as e:
+                ex = e
+                logger.info(f'Fail in start aria2 daemon, trying to restart...')
+                aria2 = aria2_process = None
     raise ex
 
 
@@ -113,15 +119,33 @@ def pause_download():
 
 
 def download(url, save_dir=None, options=None, download_in_background=False):
-    origin_no_proxy = os.environ.get('no_proxy')
-    os.environ['no_proxy'] = '127.0.0.1,localhost'
+    _enter_no_proxy()
     try:
         return _download(url, save_dir, options, download_in_background)
     finally:
-        if origin_no_proxy is None:
-            del os.environ['no_proxy']
-        else:
-            os.environ['no_proxy'] = origin_no_proxy
+        _exit_no_proxy()
+
+
+def _enter_no_proxy():
+    # keep aria2 rpc calls off the proxy while any download is running,
+    # the origin value is restored by the last one to finish
+    global _no_proxy_users, _origin_no_proxy
+    with _no_proxy_lock:
+        if _no_proxy_users == 0:
+            _origin_no_proxy = os.environ.get('no_proxy')
+            os.environ['no_proxy'] = '127.0.0.1,localhost'
+        _no_proxy_users += 1
+
+
+def _exit_no_proxy():
+    global _no_proxy_users
+    with _no_proxy_lock:
+        _no_proxy_users -= 1
+        if _no_proxy_users == 0:
+            if _origin_no_proxy is None:
+                os.environ.pop('no_proxy', None)
+            else:
+                os.environ['no_proxy'] = _origin_no_proxy
 
 
 def _download(url, save_dir=None, options=None, download_in_background=False):
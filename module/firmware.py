@@ -8,7 +8,8 @@ from module.msg_notifier import send_notify
 from functools import lru_cache
 from config import config
 from module.downloader import download
-from module.network import get_finial_url, get_durable_cache_session, request_github_api, get_github_download_url
+from module.network import get_finial_url, get_durable_cache_session, request_github_api, get_github_download_url, \
+    json_loads
 
 from exception.common_exception import IgnoredException
 import urllib.parse
@@ -111,7 +112,7 @@ def get_firmware_infos_from_nsarchive():
     url = 'https://nsarchive.e6ex.com/nsf/firmwares.json'
     resp = get_durable_cache_session().get(get_finial_url(url), timeout=15)
     res = []
-    for info in resp.json():
+    for info in json_loads(resp.content):
         info['version'] = info['name'][9:]
         info['url'] = 'https://nsarchive.e6ex.com/nsf/' + urllib.parse.quote(info['filename'])
         res.append(info)
@@ -192,13 +193,14 @@ def install_firmware(firmware_version, target_firmware_path):
         from exception.common_exception import Md5NotMatchException
         raise Md5NotMatchException()
     import zipfile
+    from utils.package import extract_zip
     with zipfile.ZipFile(file.path, 'r') as zf:
         firmware_path = target_firmware_path
         shutil.rmtree(firmware_path, ignore_errors=True)
         firmware_path.mkdir(parents=True, exist_ok=True)
         send_notify(f'开始解压安装固件...')
         logger.info(f'Unzipping firmware files to {firmware_path}')
-        zf.extractall(firmware_path)
+        extract_zip(zf, firmware_path)
         logger.info(f'Firmware of [{firmware_version}] install successfully.')
     if config.setting.download.autoDeleteAfterInstall:
         os.remove(file.path)
@@ -1,3 +1,14 @@
+import threading
+import time
+
+# progress messages (prefixed with ^) sent more often than this are merged
+progress_interval = 0.05
+_progress_lock = threading.Lock()
+_pending_progress = None
+_last_progress_time = 0.0
+# hub of the thread serving eel, the websockets must only be written from there
+_eel_hub = None
+
 
 def dummy_notifier(msg):
     pass
@@ -9,6 +20,36 @@ def eel_notifier(msg):
 
 
 def eel_console_notifier(msg):
+    global _pending_progress, _last_progress_time
+    with _progress_lock:
+        if isinstance(msg, str) and msg.startswith('^'):
+            now = time.monotonic()
+            if now - _last_progress_time < progress_interval:
+                # only the latest progress line is shown by the console
+                if _pending_progress is None:
+                    import gevent
+                    # runs on the eel hub, send_notify hands every message over to it
+                    gevent.spawn_later(progress_interval, _flush_pending_progress)
+                _pending_progress = msg
+                return
+            _last_progress_time = now
+            _pending_progress = None
+        elif _pending_progress:
+            # the console splits on new line, so send both in one frame
+            msg = _pending_progress + '\n' + msg
+            _pending_progress = None
+    import eel
+    eel.appendConsoleMessage(msg)
+
+
+def _flush_pending_progress():
+    global _pending_progress, _last_progress_time
+    with _progress_lock:
+        msg = _pending_progress
+        _pending_progress = None
+        if msg is None:
+            return
+        _last_progress_time = time.monotonic()
     import eel
     eel.appendConsoleMessage(msg)
 
@@ -17,7 +58,15 @@ notifier = dummy_notifier
 
 
 def update_notifier(mode):
-    global notifier
+    """
+    Switch the notifier, call it from the thread which is going to run eel.start.
+    """
+    global notifier, _eel_hub
+    if mode in ('eel', 'eel-console'):
+        import gevent
+        _eel_hub = gevent.get_hub()
+    else:
+        _eel_hub = None
     if mode == 'eel':
         notifier = eel_notifier
     elif mode == 'eel-console':
@@ -27,4 +76,9 @@ def update_notifier(mode):
 
 
 def send_notify(msg):
+    hub = _eel_hub
+    if hub is not None and hub.thread_ident != threading.get_ident():
+        # called from a worker thread, hand the message over to the eel thread
+        hub.loop.run_callback_threadsafe(notifier, msg)
+        return
     notifier(msg)
@@ -1,13 +1,27 @@
+import json
 import urllib.request
 from config import config, user_agent
 import logging
 import os
+import time
+from collections import deque
 import requests_cache
 from requests.adapters import HTTPAdapter
-from gevent.lock import RLock
+from gevent.lock import BoundedSemaphore
 import random
+import socket
+import threading
 from module.msg_notifier import send_notify
+from utils.singleflight import SingleFlight
+from utils.ttl_cache import ttl_cache, invalidate
 from urllib.parse import urlparse
+from pathlib import Path
+from functools import lru_cache
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +31,9 @@ url_override_map = {
     # 'https://aka.ms/vs': 'https://nsarchive.e6ex.com/msvc'
     'https://raw.githubusercontent.com': 'https://ghproxy.net/https://raw.githubusercontent.com',
 }
+# longest prefix first, so a more specific rule wins over a shorter one
+_overrides_sorted = tuple(sorted(url_override_map.items(), key=lambda kv: -len(kv[0])))
+_override_prefixes = tuple(k for k, _ in _overrides_sorted)
 
 
 github_us_mirrors = [
@@ -71,29 +88,38 @@ session = requests_cache.CachedSession(cache_control=True, backend='memory')
 _durable_cache_session = requests_cache.CachedSession(cache_control=True)
 
 
+def _create_retry_adapter():
+    from urllib3.util import Retry
+    # 403 / 429 from github are left to the token rotation in _request_github_api
+    retry = Retry(total=5, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                  allowed_methods=frozenset(['GET', 'HEAD']), raise_on_status=False)
+    return HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=retry)
+
+
 def init_session():
+    # an adapter keeps one connection pool per host, so a single one can serve every mount
+    adapter = _create_retry_adapter()
     session.headers.update({'User-Agent': user_agent})
-    session.mount('https://cfrp.e6ex.com', HTTPAdapter(max_retries=5))
-    session.mount('https://nsarchive.e6ex.com', HTTPAdapter(max_retries=5))
-    session.mount('https://api.github.com', HTTPAdapter(max_retries=5))
+    session.mount('https://cfrp.e6ex.com', adapter)
+    session.mount('https://nsarchive.e6ex.com', adapter)
+    session.mount('https://api.github.com', adapter)
+    durable_adapter = _create_retry_adapter()
     _durable_cache_session.headers.update({'User-Agent': user_agent})
-    _durable_cache_session.mount('https://ghproxy.net', HTTPAdapter(max_retries=5))
-    _durable_cache_session.mount('https://nsarchive.e6ex.com', HTTPAdapter(max_retries=5))
+    _durable_cache_session.mount('https://ghproxy.net', durable_adapter)
+    _durable_cache_session.mount('https://nsarchive.e6ex.com', durable_adapter)
     origin_get = _durable_cache_session.get
 
     def sync_get(url: str, params=None, **kwargs):
-        request_lock.acquire()
-        try:
+        with request_lock:
             return origin_get(url, params, **kwargs)
-        finally:
-            request_lock.release()
 
     _durable_cache_session.get = sync_get
     session.proxies.update(get_proxies())
     _durable_cache_session.proxies.update(get_proxies())
 
 
-request_lock = RLock()
+# caps concurrent durable-cache requests instead of serializing all of them
+request_lock = BoundedSemaphore(8)
 
 
 def get_durable_cache_session():
@@ -112,14 +138,26 @@ options_on_cdn = {
     'min-split-size': '12M',
 }
 
+github_etag_cache_path = Path('github_etag_cache.json')
+_github_etag_cache = None
+# concurrent downloads may save the cache at the same time, see storage.dump_storage
+_github_etag_write_lock = threading.Lock()
+_github_api_flight = SingleFlight()
+# origin url -> (monotonic time, decoded json), shared by the direct and cdn paths
+_github_json_cache = {}
+github_json_cache_ttl = 60
+# comma separated GitHub tokens, used round-robin for direct api requests
+_github_tokens = deque(t.strip() for t in os.environ.get('GH_TOKENS', '').split(',') if t.strip())
+_github_token_cooldown = {}
 chrome_ua = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) ' \
             'Chrome/113.0.0.0 Safari/537.36'
 github_api_fallback_flag = False
 
 
-def is_using_proxy():
-    proxies = get_proxies()
-    logger.info(f'current proxies: {proxies}')
+def is_using_proxy(proxies=None):
+    if proxies is None:
+        proxies = get_proxies()
+    logger.debug(f'current proxies: {proxies}')
     return proxies and proxies.get('https')
 
 
@@ -144,7 +182,19 @@ def get_proxies():
         return {}
 
 
+def _first_proxy(proxies=None):
+    if proxies is None:
+        proxies = get_proxies()
+    return next(iter(proxies.values()), None) if proxies else None
+
+
+def invalidate_proxy_cache():
+    invalidate(get_system_proxies)
+
+
+@ttl_cache(seconds=30)
 def get_system_proxies():
+    # reading the registry is slow, system proxy changes are picked up after 30s
     proxies = {}
     if os.name == 'nt':
         proxies.update(urllib.request.getproxies_registry())
@@ -163,8 +213,9 @@ def get_global_options():
 
 def init_download_options_with_proxy(url):
     options = {'user-agent': user_agent if 'e6ex.com' in url else chrome_ua}
-    if is_using_proxy():
-        options['all-proxy'] = iter(get_proxies().values()).__next__()
+    proxies = get_proxies()
+    if is_using_proxy(proxies):
+        options['all-proxy'] = _first_proxy(proxies)
         options.update(options_on_proxy)
     else:
         options.update(options_on_cdn)
@@ -198,8 +249,19 @@ def get_github_download_url(origin_url: str):
 def get_finial_url(origin_url: str):
     network_setting = config.setting.network
     if origin_url.startswith('https://api.github.com'):
-        return get_finial_url_with_mode(origin_url, network_setting.githubApiMode)
-    return get_finial_url_with_mode(origin_url, network_setting.firmwareDownloadSource)
+        mode = network_setting.githubApiMode
+    else:
+        mode = network_setting.firmwareDownloadSource
+    if mode not in ('direct', 'cdn'):
+        # resolve auto-detect outside the cache, the proxy state may change at any time
+        mode = 'direct' if is_using_proxy() else 'cdn'
+    return _get_finial_url_cached(origin_url, mode)
+
+
+@lru_cache(4096)
+def _get_finial_url_cached(origin_url: str, mode: str):
+    # only called with direct / cdn, which depend on nothing but the arguments
+    return get_finial_url_with_mode(origin_url, mode)
 
 
 def get_finial_url_with_mode(origin_url: str, mode: str):
@@ -223,9 +285,13 @@ def get_finial_url_with_mode(origin_url: str, mode: str):
 
 
 def get_override_url(origin_url):
-    for k in url_override_map:
+    # str.startswith(tuple) rejects the common no-match case in one C-level call
+    if not origin_url.startswith(_override_prefixes):
+        logger.info(f'using origin url: {origin_url}')
+        return origin_url
+    for k, v in _overrides_sorted:
         if origin_url.startswith(k):
-            new_url = origin_url.replace(k, url_override_map[k])
+            new_url = v + origin_url[len(k):]
             logger.info(f'using new url: {new_url}')
             return new_url
     logger.info(f'using origin url: {origin_url}')
@@ -233,28 +299,137 @@ def get_override_url(origin_url):
 
 
 def is_port_in_use(port: int) -> bool:
-    import socket
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         return s.connect_ex(('127.0.0.1', port)) == 0
 
 
-def get_available_port() -> int:
-    import random
-    while True:
-        port = random.randint(20000, 60000)
-        if not is_port_in_use(port):
-            break
-    return port
+def is_port_available(port: int) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        try:
+            s.bind(('127.0.0.1', port))
+            return True
+        except OSError:
+            return False
+
+
+def get_available_port(lo: int = 20000, hi: int = 60000) -> int:
+    tried = set()
+    while len(tried) <= hi - lo:
+        port = random.randint(lo, hi)
+        if port in tried:
+            continue
+        tried.add(port)
+        # a bind attempt is a single local syscall, unlike a connect probe
+        if is_port_available(port):
+            return port
+    raise RuntimeError(f'no available port in range [{lo}, {hi}]')
+
+
+def _get_github_etag_cache():
+    global _github_etag_cache
+    if _github_etag_cache is None:
+        _github_etag_cache = {}
+        if github_etag_cache_path.exists():
+            try:
+                with open(github_etag_cache_path, 'r', encoding='utf-8') as f:
+                    _github_etag_cache = json.load(f)
+            except Exception as e:
+                logger.warning(f'Fail to load github etag cache, msg: {str(e)}')
+    return _github_etag_cache
+
+
+def _update_github_etag_cache(url: str, etag: str, last_modified: str, data):
+    cache = _get_github_etag_cache()
+    cache[url] = {'etag': etag, 'last_modified': last_modified, 'data': data}
+    tmp_path = github_etag_cache_path.with_name(github_etag_cache_path.name + '.tmp')
+    with _github_etag_write_lock:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(cache), f, ensure_ascii=False)
+        os.replace(tmp_path, github_etag_cache_path)
+
+
+def _next_github_token():
+    now = time.time()
+    for _ in range(len(_github_tokens)):
+        token = _github_tokens[0]
+        _github_tokens.rotate(-1)
+        if _github_token_cooldown.get(token, 0) <= now:
+            return token
+    return None
+
+
+def _cooldown_github_token(token: str, resp):
+    reset_at = resp.headers.get('X-RateLimit-Reset')
+    _github_token_cooldown[token] = int(reset_at) if reset_at else time.time() + 3600
+    logger.info(f'GitHub token ...{token[-4:]} is rate limited until {_github_token_cooldown[token]}')
+
+
+def request_text_with_etag_cache(origin_url: str):
+    """
+    GET a text resource, revalidating it with the ETag saved on disk.
+    :param origin_url: url before mirror rewriting, used as cache key
+    :return: response text
+    """
+    cached = _get_github_etag_cache().get(origin_url)
+    headers = {'If-None-Match': cached['etag']} if cached else None
+    resp = session.get(get_finial_url(origin_url), headers=headers)
+    if cached and resp.status_code == 304:
+        logger.info(f'{origin_url} not modified, use cached text')
+        return cached['data']
+    if resp.status_code == 200 and resp.headers.get('ETag'):
+        _update_github_etag_cache(origin_url, resp.headers['ETag'], resp.headers.get('Last-Modified'), resp.text)
+    return resp.text
 
 
 def request_github_api(url: str):
+    """
+    request_github_api, direct requests are revalidated with the ETag saved on disk
+    :param url: GitHub api url
+    :return: decoded json
+    """
+    # callers inside session.cache_disabled() want a fresh response
+    use_cache = not session.settings.disabled
+    hit = _github_json_cache.get(url) if use_cache else None
+    if hit and time.monotonic() - hit[0] < github_json_cache_ttl:
+        return hit[1]
+    data = _github_api_flight.do(url, _request_github_api, url)
+    if is_successful_api_data(data):
+        _github_json_cache[url] = (time.monotonic(), data)
+    return data
+
+
+def is_successful_api_data(data):
+    """
+    Error responses of GitHub and Gitea api are a dict with a message, don't cache them.
+    :return: True for a list or a release dict carrying tag_name
+    """
+    return isinstance(data, list) or (isinstance(data, dict) and 'tag_name' in data)
+
+
+def _request_github_api(url: str):
     global github_api_fallback_flag
     logger.info(f'requesting github api: {url}')
     from module.msg_notifier import send_notify
     if config.setting.network.githubApiMode != 'cdn' and not github_api_fallback_flag:
+        cached = _get_github_etag_cache().get(url)
         try:
-            resp = session.get(url, timeout=5)
-            data = resp.json()
+            headers = {}
+            if cached:
+                headers['If-None-Match'] = cached['etag']
+                if cached.get('last_modified'):
+                    headers['If-Modified-Since'] = cached['last_modified']
+            token = _next_github_token()
+            if token:
+                headers['Authorization'] = f'Bearer {token}'
+            resp = session.get(url, timeout=(3, 10), headers=headers)
+            if token and resp.status_code in (403, 429) and resp.headers.get('X-RateLimit-Remaining') == '0':
+                _cooldown_github_token(token, resp)
+                if _next_github_token():
+                    return _request_github_api(url)
+            if cached and resp.status_code == 304:
+                logger.info(f'github api not modified, use cached data: {url}')
+                return cached['data']
+            data = json_loads(resp.content)
             if isinstance(data, dict) and 'message' in data and 'API rate limit exceeded' in data["message"]:
                 logger.warning(f'GitHub API response message: {data["message"]}')
                 send_notify(f'GitHub API response message: {data["message"]}')
@@ -262,14 +437,20 @@ def request_github_api(url: str):
                 send_notify(f'如果在多次使用中看到这个提示，可以直接在设置中将 GitHub api 设置为使用 cdn，以避免不必要的重试')
                 github_api_fallback_flag = True
             else:
+                if resp.status_code == 200 and resp.headers.get('ETag'):
+                    _update_github_etag_cache(url, resp.headers['ETag'], resp.headers.get('Last-Modified'), data)
                 return data
         except Exception as e:
             logger.warning(f'Error occur when requesting github api, msg: {str(e)}')
+            if cached:
+                # stale-if-error, the last good response beats a round trip through the cdn
+                logger.info(f'use stale cached data for: {url}')
+                return cached['data']
             send_notify(f'直连 GitHub api 时出现异常, 尝试转用 CDN')
             send_notify(f'如果在多次使用中看到这个提示，可以直接在设置中将 GitHub api 设置为使用 cdn，以避免不必要的重试')
             github_api_fallback_flag = True
     url = get_override_url(url)
-    return session.get(url).json()
+    return json_loads(session.get(url).content)
 
 
 def test_github_us_mirrors():
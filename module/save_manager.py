@@ -94,7 +94,7 @@ def open_yuzu_save_backup_folder():
     path = Path(storage.yuzu_save_backup_path)
     path.mkdir(parents=True, exist_ok=True)
     logger.info(f'open explorer on path {path}')
-    subprocess.Popen(f'explorer "{str(path.absolute())}"')
+    subprocess.Popen(['explorer', str(path.absolute())])
 
 
 def parse_backup_info(file: Path):
@@ -122,7 +122,7 @@ def open_suyu_keys_folder():
     keys_path.mkdir(parents=True, exist_ok=True)
     keys_path.joinpath('把prod.keys放当前目录.txt').touch(exist_ok=True)
     logger.info(f'open explorer on path {keys_path}')
-    subprocess.Popen(f'explorer "{str(keys_path.absolute())}"')
+    subprocess.Popen(['explorer', str(keys_path.absolute())])
     
     
 def _get_suyu_data_storage_config(user_path: Path):
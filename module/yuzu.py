@@ -1,8 +1,11 @@
 import os
+import re
 import shutil
 import subprocess
-import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 import logging
 from config import config, dump_config, YuzuConfig
@@ -16,6 +19,25 @@ from exception.common_exception import VersionNotFoundException, IgnoredExceptio
 
 
 logger = logging.getLogger(__name__)
+# (predicate, url_transform) pairs, the first asset matching any rule is used as the download url
+_ASSET_RULES = [
+    (lambda a: a['content_type'] == 'application/x-7z-compressed',
+     lambda a: get_github_download_url(a['browser_download_url'])),
+    (lambda a: a['name'].startswith('Windows-Yuzu-EA-') and a['name'].endswith('.zip'),
+     lambda a: get_github_download_url(a['browser_download_url'])),
+]
+_WIN_TITLE_RE = re.compile(r'^(yuzu Early Access |yuzu )(.+)$')
+_PREFIX_TO_BRANCH = {'yuzu Early Access ': 'ea', 'yuzu ': 'mainline'}
+_EXE_SET = frozenset(('yuzu.exe', 'cemu.exe'))
+_yuzu_path_cache = {'key': None, 'val': None}
+_POPEN_FLAGS = (subprocess.CREATE_NO_WINDOW | subprocess.DETACHED_PROCESS) if os.name == 'nt' else 0
+
+
+def _yuzu_path() -> Path:
+    raw_path = config.yuzu.yuzu_path
+    if _yuzu_path_cache['key'] != raw_path:
+        _yuzu_path_cache.update(key=raw_path, val=Path(raw_path))
+    return _yuzu_path_cache['val']
 
 
 def download_yuzu(target_version, branch):
@@ -24,18 +46,11 @@ def download_yuzu(target_version, branch):
     if not release_info.get('tag_name'):
         raise VersionNotFoundException(target_version, branch, 'yuzu')
     logger.info(f'target yuzu version: {target_version}')
-    yuzu_path = Path(config.yuzu.yuzu_path)
+    yuzu_path = _yuzu_path()
     logger.info(f'target yuzu path: {yuzu_path}')
     send_notify('开始下载 yuzu...')
     assets = release_info['assets']
-    url = None
-    for asset in assets:
-        if asset['content_type'] == 'application/x-7z-compressed':
-            url = get_github_download_url(asset['browser_download_url'])
-            break
-        elif asset['name'].startswith('Windows-Yuzu-EA-') and asset['name'].endswith('.zip'):
-            url = get_github_download_url(asset['browser_download_url'])
-            break
+    url = next((fn(asset) for asset in assets for pred, fn in _ASSET_RULES if pred(asset)), None)
     if not url:
         raise IgnoredException('Fail to fetch yuzu download url.')
     logger.info(f"downloading yuzu from {url}")
@@ -48,28 +63,35 @@ def unzip_yuzu(package_path: Path):
     logger.info(f'Unpacking yuzu files...')
     send_notify('正在解压 yuzu 文件...')
     from utils.package import uncompress
-    target_dir = tempfile.gettempdir()
+    # extract on the same volume as yuzu, so files can be moved into place instead of being written twice
+    target_dir = _yuzu_path().joinpath('.ns-emu-tools-install')
+    shutil.rmtree(target_dir, ignore_errors=True)
+    # leftovers of background removals which didn't finish before the app exited
+    for leftover in _yuzu_path().glob(f'{target_dir.name}.del.*'):
+        shutil.rmtree(leftover, ignore_errors=True)
     uncompress(package_path, target_dir)
     return target_dir
 
 
 def install_ea_yuzu(target_version):
-    yuzu_path = Path(config.yuzu.yuzu_path)
+    yuzu_path = _yuzu_path()
     yuzu_package_path = download_yuzu(target_version, 'ea')
-    unzip_yuzu(yuzu_package_path)
-    tmp_dir = Path(tempfile.gettempdir()).joinpath('yuzu-windows-msvc-early-access')
+    extract_dir = unzip_yuzu(yuzu_package_path)
+    tmp_dir = extract_dir.joinpath('yuzu-windows-msvc-early-access')
     copy_back_yuzu_files(tmp_dir, yuzu_path)
+    _remove_tmp_dir_in_background(extract_dir)
     logger.info(f'Yuzu EA of [{target_version}] install successfully.')
     if config.setting.download.autoDeleteAfterInstall:
         os.remove(yuzu_package_path)
 
 
 def install_mainline_yuzu(target_version):
-    yuzu_path = Path(config.yuzu.yuzu_path)
+    yuzu_path = _yuzu_path()
     yuzu_package_path = download_yuzu(target_version, 'mainline')
-    unzip_yuzu(yuzu_package_path)
-    tmp_dir = Path(tempfile.gettempdir()).joinpath('yuzu-windows-msvc')
+    extract_dir = unzip_yuzu(yuzu_package_path)
+    tmp_dir = extract_dir.joinpath('yuzu-windows-msvc')
     copy_back_yuzu_files(tmp_dir, yuzu_path)
+    _remove_tmp_dir_in_background(extract_dir)
     logger.info(f'Yuzu mainline of [{target_version}] install successfully.')
     if config.setting.download.autoDeleteAfterInstall:
         os.remove(yuzu_package_path)
@@ -81,33 +103,75 @@ def copy_back_yuzu_files(tmp_dir: Path, yuzu_path: Path, ):
     logger.info(f'Copy back yuzu files...')
     send_notify('安装 yuzu 文件至目录...')
     try:
-        shutil.copytree(tmp_dir, yuzu_path, dirs_exist_ok=True)
+        yuzu_path.mkdir(parents=True, exist_ok=True)
+        if os.stat(tmp_dir).st_dev == os.stat(yuzu_path).st_dev:
+            _move_tree(tmp_dir, yuzu_path)
+        else:
+            shutil.copytree(tmp_dir, yuzu_path, dirs_exist_ok=True)
         time.sleep(0.5)
     except Exception as e:
         from exception.install_exception import FailToCopyFiles
         raise FailToCopyFiles(e, 'Yuzu 文件复制失败')
-    shutil.rmtree(tmp_dir)
+
+
+def _move_tree(src_dir: Path, dst_dir: Path):
+    # same volume, so each file is a rename instead of a data copy
+    for dirpath, dirnames, filenames in os.walk(src_dir):
+        target_dir = os.path.join(dst_dir, os.path.relpath(dirpath, src_dir))
+        os.makedirs(target_dir, exist_ok=True)
+        for filename in filenames:
+            os.replace(os.path.join(dirpath, filename), os.path.join(target_dir, filename))
+
+
+def _remove_tmp_dir_in_background(tmp_dir: Path):
+    # move the directory out of the way first, so the next install never sees a half deleted tmp_dir
+    victim = tmp_dir.with_name(f'{tmp_dir.name}.del.{os.getpid()}.{time.time_ns()}')
+    try:
+        os.replace(tmp_dir, victim)
+    except OSError as e:
+        logger.info(f'Fail to rename {tmp_dir}, remove it in foreground, msg: {str(e)}')
+        shutil.rmtree(tmp_dir)
+        return
+    threading.Thread(target=shutil.rmtree, args=(victim,), kwargs={'ignore_errors': True}, daemon=True).start()
+
+
+def _get_yuzu_exe_sha():
+    exe_path = get_yuzu_exe_path()
+    if not exe_path.exists():
+        return None
+    import hashlib
+    sha256 = hashlib.sha256()
+    with exe_path.open('rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()[:16]
 
 
 def install_yuzu(target_version, branch='ea'):
-    if target_version == config.yuzu.yuzu_version:
+    if target_version == config.yuzu.yuzu_version and \
+            (not config.yuzu.installed_sha or _get_yuzu_exe_sha() == config.yuzu.installed_sha):
         logger.info(f'Current yuzu version is same as target version [{target_version}], skip install.')
         send_notify(f'当前就是 [{target_version}] 版本的 yuzu , 跳过安装.')
         return
-    yuzu_path = Path(config.yuzu.yuzu_path)
-    if branch == 'ea':
-        install_ea_yuzu(target_version)
-    else:
-        install_mainline_yuzu(target_version)
-    if config.setting.other.rename_yuzu_to_cemu and yuzu_path.joinpath('yuzu.exe').exists():
-        os.replace(yuzu_path.joinpath('yuzu.exe'), yuzu_path.joinpath("cemu.exe"))
-        logger.info(f'Rename yuzu.exe to {yuzu_path.joinpath("cemu.exe")}')
-        send_notify(f'重命名 yuzu.exe 为 {yuzu_path.joinpath("cemu.exe")}')
-    config.yuzu.yuzu_version = target_version
-    config.yuzu.branch = branch
-    dump_config()
-    from module.common import check_and_install_msvc
-    check_and_install_msvc()
+    from module.common import check_and_install_msvc, get_msvc_status
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # scan the registry for msvc while installing yuzu, the notify / download part runs here afterwards
+        fut_msvc = executor.submit(get_msvc_status)
+        yuzu_path = _yuzu_path()
+        if branch == 'ea':
+            install_ea_yuzu(target_version)
+        else:
+            install_mainline_yuzu(target_version)
+        if config.setting.other.rename_yuzu_to_cemu and yuzu_path.joinpath('yuzu.exe').exists():
+            os.replace(yuzu_path.joinpath('yuzu.exe'), yuzu_path.joinpath("cemu.exe"))
+            logger.info(f'Rename yuzu.exe to {yuzu_path.joinpath("cemu.exe")}')
+            send_notify(f'重命名 yuzu.exe 为 {yuzu_path.joinpath("cemu.exe")}')
+        config.yuzu.yuzu_version = target_version
+        config.yuzu.branch = branch
+        config.yuzu.installed_sha = _get_yuzu_exe_sha()
+        dump_config()
+        msvc_status = fut_msvc.result()
+    check_and_install_msvc(msvc_status)
     send_notify(f'yuzu {branch} [{target_version}] 安装成功.')
 
 
@@ -126,10 +190,19 @@ def install_firmware_to_yuzu(firmware_version=None):
         send_notify(f'固件 [{firmware_version}] 安装成功，请安装相应的 key 至 yuzu.')
 
 
+def _scan_yuzu_exe_names(yz_path: Path):
+    # one directory listing instead of a stat call per candidate exe
+    try:
+        with os.scandir(yz_path) as it:
+            return {entry.name.lower() for entry in it if entry.name.lower() in _EXE_SET}
+    except OSError:
+        return set()
+
+
 def get_yuzu_exe_path():
-    yz_path = Path(config.yuzu.yuzu_path)
-    if ((config.setting.other.rename_yuzu_to_cemu or not yz_path.joinpath('yuzu.exe').exists())
-            and yz_path.joinpath('cemu.exe').exists()):
+    yz_path = _yuzu_path()
+    present = _scan_yuzu_exe_names(yz_path)
+    if (config.setting.other.rename_yuzu_to_cemu or 'yuzu.exe' not in present) and 'cemu.exe' in present:
         return yz_path.joinpath('cemu.exe')
     return yz_path.joinpath('yuzu.exe')
 
@@ -140,6 +213,7 @@ def detect_yuzu_version():
     if not yz_path.exists():
         send_notify('未能找到 yuzu 程序')
         config.yuzu.yuzu_version = None
+        config.yuzu.installed_sha = None
         dump_config()
         return None
     instances = find_all_instances('yuzu.exe')
@@ -150,27 +224,18 @@ def detect_yuzu_version():
         send_notify(f'yuzu 正在运行中, 请先关闭之.')
         return None
     send_notify(f'正在启动 yuzu ...')
-    subprocess.Popen([yz_path.absolute()])
+    process = _popen_yuzu(yz_path)
     version = None
     branch = None
     try:
-        try_cnt = 0
-        from utils.common import get_all_window_name
-        while try_cnt < 30 and not version:
-            time.sleep(0.5)
-            for window_name in get_all_window_name():
-                if window_name.startswith('yuzu '):
-                    logger.info(f'yuzu window name: {window_name}')
-                    if window_name.startswith('yuzu Early Access '):
-                        version = window_name[18:]
-                        branch = 'ea'
-                    else:
-                        version = window_name[5:]
-                        branch = 'mainline'
-                    send_notify(f'当前 yuzu 版本 [{version}]')
-                    logger.info(f'current yuzu version: {version}, branch: {branch}')
-                    break
-            try_cnt += 1
+        window_name = _wait_yuzu_window_name(process.pid)
+        m = _WIN_TITLE_RE.match(window_name) if window_name else None
+        if m:
+            logger.info(f'yuzu window name: {window_name}')
+            branch = _PREFIX_TO_BRANCH[m.group(1)]
+            version = m.group(2)
+            send_notify(f'当前 yuzu 版本 [{version}]')
+            logger.info(f'current yuzu version: {version}, branch: {branch}')
     except:
         logger.exception('error occur in get_all_window_name')
     kill_all_instances('yuzu.exe')
@@ -180,23 +245,55 @@ def detect_yuzu_version():
         config.yuzu.branch = branch
     else:
         send_notify(f'检测失败！没有找到 yuzu 窗口...')
+    if version != config.yuzu.yuzu_version:
+        # the recorded sha belongs to the previously known version
+        config.yuzu.installed_sha = _get_yuzu_exe_sha() if version else None
     config.yuzu.yuzu_version = version
     dump_config()
     return version
 
 
+def _is_yuzu_window_name(window_name: str):
+    return _WIN_TITLE_RE.match(window_name) is not None
+
+
+def _wait_yuzu_window_name(pid: int):
+    from utils.common import get_all_window_name, wait_window_name_by_event
+    try:
+        window_name = wait_window_name_by_event(pid, _is_yuzu_window_name, timeout=15)
+        if window_name:
+            return window_name
+        logger.info('No yuzu window event received, fallback to polling')
+    except (AttributeError, OSError) as e:
+        logger.info(f'Fail to wait yuzu window by WinEvent hook, fallback to polling, msg: {str(e)}')
+    try_cnt = 0
+    while try_cnt < 30:
+        time.sleep(0.5)
+        for window_name in get_all_window_name():
+            if _is_yuzu_window_name(window_name):
+                return window_name
+        try_cnt += 1
+    return None
+
+
+def _popen_yuzu(yz_path: Path):
+    # detached without console and std pipes, yuzu is a gui program and we never read its output
+    return subprocess.Popen([str(yz_path.absolute())], creationflags=_POPEN_FLAGS, close_fds=False,
+                            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
 def start_yuzu():
     yz_path = get_yuzu_exe_path()
     if yz_path.exists():
         logger.info(f'starting yuzu from {yz_path}')
-        subprocess.Popen([yz_path])
+        _popen_yuzu(yz_path)
     else:
         logger.info(f'yuzu not exist in [{yz_path}]')
         raise IgnoredException(f'yuzu not exist in [{yz_path}]')
 
 
 def get_yuzu_user_path():
-    yuzu_path = Path(config.yuzu.yuzu_path)
+    yuzu_path = _yuzu_path()
     if yuzu_path.joinpath('user/').exists():
         return yuzu_path.joinpath('user/')
     elif Path(os.environ['appdata']).joinpath('yuzu/').exists():
@@ -209,20 +306,36 @@ def open_yuzu_keys_folder():
     keys_path.mkdir(parents=True, exist_ok=True)
     keys_path.joinpath('把prod.keys放当前目录.txt').touch(exist_ok=True)
     logger.info(f'open explorer on path {keys_path}')
-    subprocess.Popen(f'explorer "{str(keys_path.absolute())}"')
+    subprocess.Popen(['explorer', str(keys_path.absolute())])
 
 
 def _get_yuzu_data_storage_config(user_path: Path):
     config_path = user_path.joinpath('config/qt-config.ini')
-    if config_path.exists():
-        import configparser
-        yuzu_qt_config = configparser.ConfigParser()
-        yuzu_qt_config.read(str(config_path.absolute()), encoding='utf-8')
-        # data = {section: dict(yuzu_qt_config[section]) for section in yuzu_qt_config.sections()}
-        # print(data)
-        data_storage = yuzu_qt_config['Data%20Storage']
-        logger.debug(dict(data_storage))
-        return data_storage
+    try:
+        mtime = os.stat(config_path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return _parse_qt_config_cached(str(config_path.absolute()), mtime)
+
+
+@lru_cache(maxsize=8)
+def _parse_qt_config_cached(config_path_str: str, mtime: int):
+    # mtime is part of the cache key, so edits to qt-config.ini invalidate the cached result.
+    # Only the [Data%20Storage] section is needed, stop reading once it ends.
+    data_storage = {}
+    in_section = False
+    with open(config_path_str, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('['):
+                if in_section:
+                    break
+                in_section = line == '[Data%20Storage]'
+            elif in_section and '=' in line:
+                k, _, v = line.partition('=')
+                data_storage[k.strip().lower()] = v.strip()
+    logger.debug(data_storage)
+    return data_storage
 
 
 def get_yuzu_nand_path():
@@ -258,7 +371,7 @@ def update_yuzu_path(new_yuzu_path: str):
     if not new_path.exists():
         logger.info(f'create directory: {new_path}')
         new_path.mkdir(parents=True, exist_ok=True)
-    if new_path.absolute() == Path(config.yuzu.yuzu_path).absolute():
+    if new_path.absolute() == _yuzu_path().absolute():
         logger.info(f'No different with old yuzu path, skip update.')
         return
     add_yuzu_history(config.yuzu)
@@ -0,0 +1,25 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from repository.ryujinx import get_all_ryujinx_release_infos
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_all_release_infos_parallel(branches):
+    """
+    Fetch ryujinx release infos of several branches concurrently.
+    Branches which fail to load are logged and left out of the result.
+    :param branches: ryujinx branch names, e.g. ['mainline', 'canary']
+    :return: dict of branch -> release infos
+    """
+    res = {}
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = {executor.submit(get_all_ryujinx_release_infos, branch): branch for branch in branches}
+        for future in as_completed(futures):
+            branch = futures[future]
+            try:
+                res[branch] = future.result()
+            except Exception as e:
+                logger.warning(f'Fail to load ryujinx {branch} release infos, msg: {str(e)}')
+    return res
@@ -0,0 +1,19 @@
+_RELEASE_KEYS = ('tag_name', 'name', 'body', 'published_at', 'html_url', 'assets')
+_ASSET_KEYS = ('name', 'content_type', 'size', 'browser_download_url')
+
+
+def strip_release_info(item: dict):
+    res = {k: item[k] for k in _RELEASE_KEYS if k in item}
+    if 'assets' in res:
+        res['assets'] = [{k: a[k] for k in _ASSET_KEYS if k in a} for a in res['assets']]
+    return res
+
+
+def strip_release_infos(data):
+    """
+    Keep only the release fields used by the tools and UI, so the lists kept in
+    memory, storage.json and sent to UI stay small.
+    """
+    if not isinstance(data, list):
+        return data
+    return [strip_release_info(item) for item in data]
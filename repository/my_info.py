@@ -1,4 +1,4 @@
-from module.network import request_github_api, session, get_finial_url
+from module.network import request_github_api, session, request_text_with_etag_cache
 
 
 def get_all_release():
@@ -18,5 +18,4 @@ def get_release_info_by_tag(tag: str):
 
 
 def load_change_log():
-    resp = session.get(get_finial_url('https://raw.githubusercontent.com/triwinds/ns-emu-tools/main/changelog.md'))
-    return resp.text
+    return request_text_with_etag_cache('https://raw.githubusercontent.com/triwinds/ns-emu-tools/main/changelog.md')
@@ -1,31 +1,59 @@
-from module.network import request_github_api, session, get_finial_url
+from module.network import request_github_api, request_text_with_etag_cache, is_successful_api_data
+from utils.ttl_cache import ttl_cache
+from storage import load_release_with_cache
+from repository.common import strip_release_infos
 
 
+@ttl_cache(seconds=300)
 def get_all_ryujinx_release_infos(branch='mainline'):
-    if branch == 'canary':
-        return get_all_canary_ryujinx_release_infos()
-    return request_github_api('https://api.github.com/repos/Ryubing/Ryujinx/releases')
+    return _GET_ALL.get(branch, get_all_mainline_ryujinx_release_infos)()
 
 
+@ttl_cache(seconds=300)
+def get_all_mainline_ryujinx_release_infos():
+    return load_release_with_cache('ryujinx_mainline', lambda: strip_release_infos(request_github_api(
+        'https://api.github.com/repos/Ryubing/Ryujinx/releases')))
+
+
+@ttl_cache(seconds=300)
 def get_all_canary_ryujinx_release_infos():
-    return request_github_api('https://api.github.com/repos/Ryubing/Canary-Releases/releases')
+    return load_release_with_cache('ryujinx_canary', lambda: strip_release_infos(request_github_api(
+        'https://api.github.com/repos/Ryubing/Canary-Releases/releases')))
 
 
 def get_latest_ryujinx_release_info():
     return get_all_ryujinx_release_infos()[0]
 
 
+@ttl_cache(seconds=300, should_cache=is_successful_api_data)
 def get_ryujinx_release_info_by_version(version, branch='mainline'):
-    if branch == 'canary':
-        return get_canary_ryujinx_release_info_by_version(version)
+    for info in get_all_ryujinx_release_infos(branch):
+        if info['tag_name'] == version:
+            return info
+    return _GET_BY_VERSION.get(branch, get_mainline_ryujinx_release_info_by_version)(version)
+
+
+@ttl_cache(seconds=300, should_cache=is_successful_api_data)
+def get_mainline_ryujinx_release_info_by_version(version):
     return request_github_api(f'https://api.github.com/repos/Ryubing/Ryujinx/releases/tags/{version}')
 
 
+@ttl_cache(seconds=300, should_cache=is_successful_api_data)
 def get_canary_ryujinx_release_info_by_version(version):
     return request_github_api(f'https://api.github.com/repos/Ryubing/Canary-Releases/releases/tags/{version}')
 
 
+@ttl_cache(seconds=300)
 def load_ryujinx_change_log():
     # todo
-    resp = session.get(get_finial_url('https://raw.githubusercontent.com/wiki/Ryujinx/Ryujinx/Changelog.md'))
-    return resp.text
+    return request_text_with_etag_cache('https://raw.githubusercontent.com/wiki/Ryujinx/Ryujinx/Changelog.md')
+
+
+_GET_ALL = {
+    'mainline': get_all_mainline_ryujinx_release_infos,
+    'canary': get_all_canary_ryujinx_release_infos,
+}
+_GET_BY_VERSION = {
+    'mainline': get_mainline_ryujinx_release_info_by_version,
+    'canary': get_canary_ryujinx_release_info_by_version,
+}
@@ -1,21 +1,26 @@
-from module.network import session, get_finial_url
+from module.network import session, get_finial_url, json_loads, is_successful_api_data
+from utils.ttl_cache import ttl_cache
+from storage import load_release_with_cache
+from repository.common import strip_release_infos
 
 
 # Api doc: https://git.suyu.dev/api/swagger
 
+@ttl_cache(seconds=300)
 def load_suyu_releases():
+    return load_release_with_cache('suyu', _load_suyu_releases)
+
+
+def _load_suyu_releases():
     resp = session.get(get_finial_url('https://git.suyu.dev/api/v1/repos/suyu/suyu/releases'))
-    return resp.json()
+    return strip_release_infos(json_loads(resp.content))
 
 
+@ttl_cache(seconds=300, should_cache=is_successful_api_data)
 def get_release_by_tag_name(tag_name: str):
     resp = session.get(get_finial_url(f'https://git.suyu.dev/api/v1/repos/suyu/suyu/releases/tags/{tag_name}'))
-    return resp.json()
+    return json_loads(resp.content)
 
 
 def get_all_suyu_release_versions():
-    res = []
-    data = load_suyu_releases()
-    for item in data:
-        res.append(item['tag_name'])
-    return res
+    return [item['tag_name'] for item in load_suyu_releases()]
@@ -1,34 +1,44 @@
-from module.network import request_github_api
+from operator import itemgetter
 
+from module.network import request_github_api, is_successful_api_data
+from utils.ttl_cache import ttl_cache
+from storage import load_release_with_cache
+from repository.common import strip_release_info
 
+_get_tag = itemgetter('tag_name')
+
+
+@ttl_cache(seconds=300)
 def get_all_yuzu_release_infos():
+    return load_release_with_cache('yuzu_ea', _load_all_yuzu_release_infos)
+
+
+def _load_all_yuzu_release_infos():
     data = request_github_api('https://api.github.com/repos/pineappleEA/pineapple-src/releases')
-    res = [item for item in data if item['author']['login'] == 'pineappleEA']
+    res = [strip_release_info(item) for item in data if item['author']['login'] == 'pineappleEA']
     return res
 
 
+@ttl_cache(seconds=300)
 def get_all_yuzu_release_versions(branch: str):
-    res = []
     if branch.lower() == 'mainline':
         data = request_github_api('https://api.github.com/repos/yuzu-emu/yuzu-mainline/releases')
-        for item in data:
-            res.append(item['tag_name'][11:])
-    else:
-        data = request_github_api('https://api.github.com/repos/pineappleEA/pineapple-src/releases')
-        for item in data:
-            if item['author']['login'] == 'pineappleEA':
-                res.append(item['tag_name'][3:])
-    return res
+        return [_get_tag(item).removeprefix('mainline-0-') for item in data]
+    return [_get_tag(item).removeprefix('EA-') for item in get_all_yuzu_release_infos()]
 
 
 def get_latest_yuzu_release_info():
     return get_all_yuzu_release_infos()[0]
 
 
+@ttl_cache(seconds=300, should_cache=is_successful_api_data)
 def get_yuzu_release_info_by_version(version, branch='ea'):
     if branch.lower() == 'mainline':
         url = f'https://api.github.com/repos/yuzu-emu/yuzu-mainline/releases/tags/mainline-0-{version}'
     else:
+        for info in get_all_yuzu_release_infos():
+            if info['tag_name'] == f'EA-{version}':
+                return info
         url = f'https://api.github.com/repos/pineappleEA/pineapple-src/releases/tags/EA-{version}'
     return request_github_api(url)
 
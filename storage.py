@@ -1,17 +1,28 @@
 from dataclasses import dataclass, field
+import atexit
 import json
 import os
+import threading
+import time
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Callable
 
 from dataclasses_json import dataclass_json, Undefined
 from config import config, YuzuConfig, RyujinxConfig, SuyuConfig
 import logging
 
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
 
 logger = logging.getLogger(__name__)
 storage_path = Path('storage.json')
 storage = None
+_dump_lock = threading.Lock()
+_write_lock = threading.Lock()
+_dump_timer = None
 
 
 @dataclass_json(undefined=Undefined.EXCLUDE)
@@ -21,17 +32,67 @@ class Storage:
     suyu_history: Dict[str, SuyuConfig] = field(default_factory=dict)
     ryujinx_history: Dict[str, RyujinxConfig] = field(default_factory=dict)
     yuzu_save_backup_path: str = str(Path(r'D:\\yuzu_save_backup'))
+    release_cache: Dict[str, dict] = field(default_factory=dict)
+
+
+def _encode_storage(indent=None) -> bytes:
+    if msgspec:
+        raw = msgspec.json.encode(storage)
+        return msgspec.json.format(raw, indent=indent) if indent else raw
+    return storage.to_json(ensure_ascii=False, indent=indent).encode('utf-8')
+
+
+def _decode_storage(raw: bytes) -> Storage:
+    if msgspec:
+        try:
+            return msgspec.json.decode(raw, type=Storage)
+        except msgspec.ValidationError as e:
+            logger.warning(f'Fail to decode storage with msgspec, fallback to dataclasses_json, msg: {str(e)}')
+    return Storage.from_dict(json.loads(raw))
 
 
-def dump_storage():
+def dump_storage(indent=None):
+    """
+    Write storage to a temp file and replace storage.json with it, so a crash
+    never leaves a half written file.
+    :param indent: indent for human-readable output, compact by default
+    """
     logger.info(f'saving storage to {storage_path.absolute()}')
-    with open(storage_path, 'w', encoding='utf-8') as f:
-        f.write(storage.to_json(ensure_ascii=False, indent=2))
+    tmp_path = storage_path.with_name(storage_path.name + '.tmp')
+    with _write_lock:
+        with open(tmp_path, 'wb') as f:
+            f.write(_encode_storage(indent))
+        os.replace(tmp_path, storage_path)
+
+
+def schedule_dump_storage(delay=0.5):
+    """
+    Dump storage after delay seconds, calls within the delay are merged into one write.
+    """
+    global _dump_timer
+    with _dump_lock:
+        if _dump_timer is not None:
+            _dump_timer.cancel()
+        _dump_timer = threading.Timer(delay, dump_storage)
+        _dump_timer.daemon = True
+        _dump_timer.start()
+
+
+def _flush_scheduled_dump():
+    global _dump_timer
+    with _dump_lock:
+        timer, _dump_timer = _dump_timer, None
+    if timer is not None and not timer.finished.is_set():
+        timer.cancel()
+        dump_storage()
+
+
+atexit.register(_flush_scheduled_dump)
 
 
 if os.path.exists(storage_path):
-    with open(storage_path, 'r', encoding='utf-8') as f:
-        storage = Storage.from_dict(json.load(f))
+    with open(storage_path, 'rb') as f:
+        storage = _decode_storage(f.read())
 if not storage:
     storage = Storage()
     dump_storage()
@@ -41,21 +102,50 @@ def add_yuzu_history(yuzu_config: YuzuConfig, dump=True):
     yuzu_path = Path(yuzu_config.yuzu_path)
     storage.yuzu_history[str(yuzu_path.absolute())] = yuzu_config
     if dump:
-        dump_storage()
+        schedule_dump_storage()
 
 
 def add_ryujinx_history(ryujinx_config: RyujinxConfig, dump=True):
     ryujinx_path = Path(ryujinx_config.path)
     storage.ryujinx_history[str(ryujinx_path.absolute())] = ryujinx_config
     if dump:
-        dump_storage()
+        schedule_dump_storage()
 
 
 def add_suyu_history(suyu_config: SuyuConfig, dump=True):
     suyu_path = Path(suyu_config.path)
     storage.suyu_history[str(suyu_path.absolute())] = suyu_config
     if dump:
-        dump_storage()
+        schedule_dump_storage()
+
+
+def _refresh_release_cache(key: str, loader: Callable):
+    data = loader()
+    storage.release_cache[key] = {'cached_at': time.time(), 'data': data}
+    schedule_dump_storage()
+    return data
+
+
+def _refresh_release_cache_quietly(key: str, loader: Callable):
+    try:
+        _refresh_release_cache(key, loader)
+    except Exception as e:
+        logger.warning(f'Fail to refresh release cache of {key}, msg: {str(e)}')
+
+
+def load_release_with_cache(key: str, loader: Callable, max_age=3600):
+    """
+    Return the release list saved in storage if it is younger than max_age
+    and refresh it in background, otherwise load it with loader.
+    :param key: cache key, e.g. ryujinx_mainline
+    :param loader: function that loads the release list from network
+    :param max_age: max age of the saved release list in seconds
+    """
+    item = storage.release_cache.get(key)
+    if item and time.time() - item['cached_at'] < max_age:
+        threading.Thread(target=_refresh_release_cache_quietly, args=(key, loader), daemon=True).start()
+        return item['data']
+    return _refresh_release_cache(key, loader)
 
 
 def delete_history_path(emu_type: str, path_to_delete: str):
@@ -69,7 +159,7 @@ def delete_history_path(emu_type: str, path_to_delete: str):
     if abs_path in history:
         del history[abs_path]
         logger.info(f'{emu_type} path {abs_path} deleted.')
-        dump_storage()
+        schedule_dump_storage()
 
 
 if __name__ == '__main__':
@@ -1,11 +1,12 @@
 import logging
+from functools import lru_cache
 from typing import Optional
-import eel
 from config import config, dump_config, shared
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(1)
 def can_use_chrome():
     """ Identify if Chrome is available for Eel to use """
     import os
@@ -14,6 +15,7 @@ def can_use_chrome():
     return chrome_instance_path is not None and os.path.exists(chrome_instance_path)
 
 
+@lru_cache(1)
 def can_use_edge():
     try:
         import winreg
@@ -26,6 +28,7 @@ def can_use_edge():
         return False
 
 
+@lru_cache(1)
 def _find_edge_win() -> Optional[str]:
     import winreg as reg
     import os
@@ -46,17 +49,18 @@ def _find_edge_win() -> Optional[str]:
 
 def start_edge_in_app_mode(page, port, size=(1280, 720)):
     if port == 0:
-        from module.network import get_available_port
-        port = get_available_port()
+        raise ValueError('port should be resolved by caller')
     url = f'http://127.0.0.1:{port}/{page}'
+    import eel
     import subprocess
+    creationflags = subprocess.CREATE_NO_WINDOW | subprocess.DETACHED_PROCESS
     try:
-        subprocess.Popen(f'"{_find_edge_win()}" --app={url}',
-                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL, shell=True)
+        subprocess.Popen([_find_edge_win(), f'--app={url}'], creationflags=creationflags, close_fds=True,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL)
     except Exception as e:
         logger.info(f'Fail to start Edge with full path, fallback with "start" command, exception: {str(e)}')
-        subprocess.Popen(f'start msedge --app={url}',
-                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL, shell=True)
+        subprocess.Popen(['cmd', '/c', 'start', 'msedge', f'--app={url}'], creationflags=creationflags,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL)
     eel.start(url, port=port, mode=False, size=size)
 
 
@@ -65,10 +69,12 @@ def import_api_modules():
 
 
 def main(port=0, mode=None, dev=False):
+    import eel
     import_api_modules()
     logger.info('eel init starting...')
     # eel.init('vue/public') if dev else eel.init("web")
-    eel.init("web")
+    # only js/html may reference exposed functions, skip scanning fonts/images
+    eel.init("web", allowed_extensions=['.js', '.html'])
     shutdown_delay = 114514 if dev else 1
     logger.info('eel init finished.')
     from module.msg_notifier import update_notifier
@@ -104,8 +110,5 @@ def main(port=0, mode=None, dev=False):
 
 
 if __name__ == '__main__':
-    import gevent.monkey
-
-    gevent.monkey.patch_ssl()
-    gevent.monkey.patch_socket()
+    import bootstrap
     main(8888, False, True)
@@ -1,8 +1,6 @@
 import logging
 import os
 
-import eel
-import webview
 from utils.webview2 import ensure_runtime_components
 from config import config, shared, dump_config
 from threading import Timer
@@ -29,26 +27,33 @@ def check_webview_status():
 def maximize_window():
     if os.name != 'nt':
         return
-    from webview.platforms.winforms import WinForms, Func, Type, BrowserView
+    from webview.platforms.winforms import WinForms, BrowserView
 
     def _maximize():
         BrowserView.instances['master'].WindowState = WinForms.FormWindowState.Maximized
-    BrowserView.instances['master'].Invoke(Func[Type](_maximize))
+    # post to the ui thread without waiting for it
+    BrowserView.instances['master'].BeginInvoke(WinForms.MethodInvoker(_maximize))
 
 
 def get_window_size():
+    import webview
     return webview.windows[0].width, webview.windows[0].height
 
 
 def post_start(fullscreen):
+    import eel
     Timer(10.0, check_webview_status).start()
     if fullscreen:
         Timer(0.5, maximize_window).start()
     shared['mode'] = 'webview'
+    from module.msg_notifier import update_notifier
+    # eel is served from this thread, bind the console notifier to it
+    update_notifier('eel-console')
     eel.start(default_page, port=port, mode=False)
 
 
 def close_all_windows():
+    import webview
     if webview.windows:
         logger.info('Closing all windows...')
         for win in webview.windows:
@@ -59,19 +64,22 @@ def main():
     if ensure_runtime_components():
         return
     global port
+    import eel
+    import webview
     import_api_modules()
     logger.info('eel init starting...')
-    eel.init('vue/public') if port else eel.init("web")
+    # only js/html may reference exposed functions, skip scanning fonts/images
+    web_root = 'vue/public' if port else 'web'
+    eel.init(web_root, allowed_extensions=['.js', '.html'])
     logger.info('eel init finished.')
-    from module.msg_notifier import update_notifier
-    update_notifier('eel-console')
     if port == 0:
         from module.network import get_available_port
         port = get_available_port()
     url = f'http://127.0.0.1:{port}/{default_page}'
     logger.info(f'start webview with url: {url}')
     width, height = config.setting.ui.width, config.setting.ui.height
-    sw, sh = webview.screens[0].width, webview.screens[0].height
+    screen = webview.screens[0]
+    sw, sh = screen.width, screen.height
     fullscreen = sw - width < 3 and height / sh > 0.9
     logger.info(f'window size: {(width, height)}, fullscreen: {fullscreen}')
     webview.create_window('NS EMU TOOLS', url, width=width, height=height, text_select=True)
@@ -79,8 +87,5 @@ def main():
 
 
 if __name__ == '__main__':
-    import gevent.monkey
-
-    gevent.monkey.patch_ssl()
-    gevent.monkey.patch_socket()
+    import bootstrap
     main()
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 import requests
 import requests_cache
@@ -12,34 +13,75 @@ gh_token = os.environ.get('gh_token')
 headers = {
     'Authorization': f'Bearer {gh_token}'
 } if gh_token else {}
+session = requests.Session()
+session.headers.update(headers)
+# kept outside the repo, the update workflow commits everything in the working tree
+etag_cache_path = os.path.join(tempfile.gettempdir(), 'ns_emu_tools_game_data_etag_cache.json')
 
 
-def update_with_page(game_data, page):
-    resp = requests.get(f'https://api.github.com/repos/Ryujinx/Ryujinx-Games-List/issues?page={page}',
-                        headers=headers)
+def load_etag_cache():
+    if not os.path.exists(etag_cache_path):
+        return {}
+    with open(etag_cache_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_etag_cache(etag_cache):
+    with open(etag_cache_path, 'w', encoding='utf-8') as f:
+        json.dump(etag_cache, f, ensure_ascii=False)
+
+
+def fetch_page(page, etag_cache=None):
+    """
+    :return: (issue count of the page, {game_id: title})
+    """
+    url = f'https://api.github.com/repos/Ryujinx/Ryujinx-Games-List/issues?page={page}'
+    cached = etag_cache.get(url) if etag_cache is not None else None
+    resp = session.get(url, headers={'If-None-Match': cached['etag']} if cached else None)
     # print(resp.headers)
     print(f'handle page {page}')
+    if cached and resp.status_code == 304:
+        print(f'page {page} not modified')
+        return cached['size'], cached['games']
     issues = resp.json()
-    print(f'issues size: {len(issues)}')
-    if not issues:
-        return False
+    games = {}
     for issue in issues:
-        title = issue['title']
-        groups = game_re.findall(title)
-        if not groups:
+        m = game_re.match(issue['title'])
+        if m is None:
             continue
-        title, game_id = groups[0]
-        game_data[game_id] = title
+        title, game_id = m.groups()
+        games[game_id] = title
+    if etag_cache is not None and resp.headers.get('ETag'):
+        etag_cache[url] = {'etag': resp.headers['ETag'], 'size': len(issues), 'games': games}
+    return len(issues), games
+
+
+def update_with_page(game_data, page, etag_cache=None):
+    size, games = fetch_page(page, etag_cache)
+    print(f'issues size: {size}')
+    if not size:
+        return False
+    game_data.update(games)
     return True
 
 
-def update_all():
-    page = 0
+def update_all(concurrency=8):
+    from concurrent.futures import ThreadPoolExecutor
+    page = 1
     game_data = {}
-    while True:
-        page += 1
-        if not update_with_page(game_data, page):
-            break
+    etag_cache = load_etag_cache()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        finished = False
+        while not finished:
+            pages = range(page, page + concurrency)
+            # results keep page order, stop at the first empty page
+            for size, games in executor.map(lambda p: fetch_page(p, etag_cache), pages):
+                if not size:
+                    finished = True
+                    break
+                game_data.update(games)
+            page += concurrency
+    save_etag_cache(etag_cache)
     if game_data:
         with open('game_data.json', 'w', encoding='utf-8') as f:
             json.dump(game_data, f, ensure_ascii=False, indent=2)
@@ -52,7 +94,9 @@ def update_latest():
     else:
         with open('game_data.json', 'r', encoding='utf-8') as f:
             game_data = json.load(f)
-    update_with_page(game_data, 1)
+    etag_cache = load_etag_cache()
+    update_with_page(game_data, 1, etag_cache)
+    save_etag_cache(etag_cache)
     with open('game_data.json', 'w', encoding='utf-8') as f:
         json.dump(game_data, f, ensure_ascii=False, indent=2)
 
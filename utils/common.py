@@ -1,59 +1,170 @@
+import os
 import re
+import subprocess
 import time
+from functools import lru_cache
 from pathlib import Path
 from module.msg_notifier import send_notify
+from utils.ttl_cache import ttl_cache
 import logging
 
 
 logger = logging.getLogger(__name__)
-path_unicode_re = re.compile(r'\\x([\da-f]{4})')
+# qt writes non-ascii chars as \xNNNN, other escapes follow python's unicode-escape
+path_escape_re = re.compile(r'\\(x[\da-f]{4}|x[\da-fA-F]{2}|u[\da-fA-F]{4}|[\\\'"abfnrtv0])', re.ASCII)
+_path_simple_escapes = {'\\': '\\', "'": "'", '"': '"', 'a': '\a', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r',
+                        't': '\t', 'v': '\v', '0': '\0'}
 
 
-def callback(hwnd, strings):
-    from win32 import win32gui
-    window_title = win32gui.GetWindowText(hwnd)
-    # left, top, right, bottom = win32gui.GetWindowRect(hwnd)
-    if window_title:
-        strings.append(window_title)
-    return True
+def get_all_window_name():
+    import ctypes
+    from ctypes import wintypes
+    user32 = ctypes.windll.user32
+    enum_windows_proc = ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HWND, wintypes.LPARAM)
+    hwnd_list = []
+    append_hwnd = hwnd_list.append
 
+    def _collect(hwnd, _):
+        append_hwnd(hwnd)
+        return True
 
-def get_all_window_name():
-    from win32 import win32gui
-    win_list = []  # list of strings containing win handles and window titles
-    win32gui.EnumWindows(callback, win_list)  # populate list
+    user32.EnumWindows(enum_windows_proc(_collect), 0)
+    win_list = []  # list of window titles
+    buf = ctypes.create_unicode_buffer(512)
+    get_window_text = user32.GetWindowTextW
+    for hwnd in hwnd_list:
+        if get_window_text(hwnd, buf, 512):
+            win_list.append(buf.value)
     return win_list
 
 
+def wait_window_name_by_event(pid: int, predicate, timeout: float = 15):
+    """
+    Wait for a window of the given process whose title matches predicate, using WinEvent hook
+    instead of polling all top level windows.
+    :return: the matched window name, or None if timeout
+    """
+    import ctypes
+    from ctypes import wintypes
+    user32 = ctypes.windll.user32
+    event_object_create, event_object_namechange = 0x8000, 0x800C
+    winevent_outofcontext, objid_window, pm_remove, qs_allinput = 0x0000, 0, 0x0001, 0x04FF
+    win_event_proc = ctypes.WINFUNCTYPE(None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND, wintypes.LONG,
+                                        wintypes.LONG, wintypes.DWORD, wintypes.DWORD)
+    user32.SetWinEventHook.restype = wintypes.HANDLE
+    user32.SetWinEventHook.argtypes = [wintypes.DWORD, wintypes.DWORD, wintypes.HMODULE, win_event_proc,
+                                       wintypes.DWORD, wintypes.DWORD, wintypes.DWORD]
+    user32.UnhookWinEvent.argtypes = [wintypes.HANDLE]
+    result = []
+
+    def _callback(hook, event, hwnd, id_object, id_child, event_thread, event_time):
+        if result or id_object != objid_window or not hwnd:
+            return
+        length = user32.GetWindowTextLengthW(hwnd)
+        if not length:
+            return
+        buf = ctypes.create_unicode_buffer(length + 1)
+        user32.GetWindowTextW(hwnd, buf, length + 1)
+        if predicate(buf.value):
+            result.append(buf.value)
+
+    proc = win_event_proc(_callback)
+    hook = user32.SetWinEventHook(event_object_create, event_object_namechange, None, proc, pid, 0,
+                                  winevent_outofcontext)
+    if not hook:
+        raise OSError('Fail to set WinEvent hook.')
+    try:
+        # the window may have got its title before the hook was set
+        for window_name in get_all_window_name():
+            if predicate(window_name):
+                return window_name
+        msg = wintypes.MSG()
+        deadline = time.monotonic() + timeout
+        while not result:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            user32.MsgWaitForMultipleObjects(0, None, False, int(min(remaining, 0.5) * 1000), qs_allinput)
+            while user32.PeekMessageW(ctypes.byref(msg), None, 0, 0, pm_remove):
+                user32.TranslateMessage(ctypes.byref(msg))
+                user32.DispatchMessageW(ctypes.byref(msg))
+    finally:
+        user32.UnhookWinEvent(hook)
+    return result[0] if result else None
+
+
 def decode_yuzu_path(raw_path_in_config: str):
-    # raw_path_in_config = raw_path_in_config.replace("'", "\'")
-    raw_path_in_config = path_unicode_re.sub(r'\\u\1', raw_path_in_config)
-    # return eval(f"'{raw_path_in_config}'")
-    return raw_path_in_config.encode().decode("unicode-escape")
+    if '\\' not in raw_path_in_config:
+        # nothing to unescape
+        return raw_path_in_config
+    return path_escape_re.sub(_unescape_path_char, raw_path_in_config)
+
+
+def _unescape_path_char(m):
+    escape = m.group(1)
+    if len(escape) > 1:
+        return chr(int(escape[1:], 16))
+    return _path_simple_escapes[escape]
 
 
 def find_all_instances(process_name: str, exe_path: Path = None):
     import psutil
     result = []
-    for p in psutil.process_iter():
-        if p.name().startswith(process_name):
-            if exe_path is not None:
-                process_path = Path(p.exe()).parent.absolute()
-                if exe_path.absolute() != process_path:
+    # compare plain normalized strings, exe() already returns an absolute path
+    exe_dir = os.path.normcase(str(exe_path.absolute())) if exe_path is not None else None
+    for p in psutil.process_iter(['name']):
+        name = p.info['name']
+        if name and name.startswith(process_name):
+            # exe() is an extra query per process, only do it for name matches
+            if exe_dir is not None:
+                try:
+                    if os.path.normcase(os.path.dirname(p.exe())) != exe_dir:
+                        continue
+                except psutil.Error:
+                    # exited or not accessible, it can't be one of ours anyway
                     continue
             result.append(p)
     return result
 
 
 def kill_all_instances(process_name: str, exe_path: Path = None):
+    if os.name == 'nt' and exe_path is None:
+        _kill_all_instances_by_taskkill(process_name)
+        return
     processes = find_all_instances(process_name, exe_path)
     if processes:
         for p in processes:
-            send_notify(f'关闭进程 {p.name()} [{p.pid}]')
+            send_notify(f'关闭进程 {p.info["name"]} [{p.pid}]')
             p.kill()
         time.sleep(1)
 
 
+def _kill_all_instances_by_taskkill(process_name: str):
+    # process_name is a prefix, e.g. 'Ryujinx.', let taskkill do the matching
+    image_name = process_name if process_name.lower().endswith('.exe') else f'{process_name}*'
+    result = subprocess.run(['taskkill', '/F', '/T', '/IM', image_name], capture_output=True,
+                            creationflags=subprocess.CREATE_NO_WINDOW)
+    if result.returncode == 0:
+        send_notify(f'关闭进程 {image_name}')
+        time.sleep(1)
+
+
+def _is_file_locked(file_path: str):
+    """
+    Open the file without sharing, this fails with a sharing violation if anyone else holds it open.
+    """
+    import ctypes
+    from ctypes import wintypes
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    kernel32.CreateFileW.restype = wintypes.HANDLE
+    handle = kernel32.CreateFileW(file_path, 0x80000000, 0, None, 3, 0x80, None)  # GENERIC_READ, OPEN_EXISTING
+    if handle == wintypes.HANDLE(-1).value:
+        # ERROR_SHARING_VIOLATION / ERROR_LOCK_VIOLATION
+        return ctypes.get_last_error() in (32, 33)
+    kernel32.CloseHandle(handle)
+    return False
+
+
 def is_path_in_use(file_path):
     # Only works under windows
     if isinstance(file_path, Path):
@@ -62,6 +173,9 @@ def is_path_in_use(file_path):
         path = Path(file_path)
     if not path.exists():
         return False
+    if os.name == 'nt' and path.is_file():
+        return _is_file_locked(str(path))
+    # a directory can't be renamed while any file inside it is open
     try:
         path.rename(path)
     except PermissionError:
@@ -70,41 +184,50 @@ def is_path_in_use(file_path):
         return False
 
 
+@ttl_cache(seconds=60)
 def get_installed_software():
+    """
+    Installed software from the Uninstall registry keys, cached for a minute.
+    Call get_installed_software.cache_clear() after installing something.
+    """
     import winreg
 
+    def query_value(key, name):
+        try:
+            return winreg.QueryValueEx(key, name)[0]
+        except OSError:
+            return 'undefined'
+
     def foo(hive, flag):
-        aReg = winreg.ConnectRegistry(None, hive)
-        aKey = winreg.OpenKey(aReg, r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall",
-                              0, winreg.KEY_READ | flag)
-        count_subkey = winreg.QueryInfoKey(aKey)[0]
         software_list = []
-        for i in range(count_subkey):
-            software = {}
-            try:
-                asubkey_name = winreg.EnumKey(aKey, i)
-                asubkey = winreg.OpenKey(aKey, asubkey_name)
-                software['name'] = winreg.QueryValueEx(asubkey, "DisplayName")[0]
-
-                try:
-                    software['version'] = winreg.QueryValueEx(asubkey, "DisplayVersion")[0]
-                except EnvironmentError:
-                    software['version'] = 'undefined'
+        with winreg.ConnectRegistry(None, hive) as aReg, \
+                winreg.OpenKey(aReg, r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall",
+                               0, winreg.KEY_READ | flag) as aKey:
+            count_subkey = winreg.QueryInfoKey(aKey)[0]
+            for i in range(count_subkey):
                 try:
-                    software['publisher'] = winreg.QueryValueEx(asubkey, "Publisher")[0]
-                except EnvironmentError:
-                    software['publisher'] = 'undefined'
-                software_list.append(software)
-            except EnvironmentError:
-                continue
-
+                    with winreg.OpenKey(aKey, winreg.EnumKey(aKey, i)) as asubkey:
+                        # entries without DisplayName are not shown as installed software, skip them first
+                        name = winreg.QueryValueEx(asubkey, "DisplayName")[0]
+                        software_list.append({
+                            'name': name,
+                            'version': query_value(asubkey, "DisplayVersion"),
+                            'publisher': query_value(asubkey, "Publisher"),
+                        })
+                except OSError:
+                    continue
         return software_list
 
+    from concurrent.futures import ThreadPoolExecutor
+    from itertools import chain
+    scans = ((winreg.HKEY_LOCAL_MACHINE, winreg.KEY_WOW64_32KEY),
+             (winreg.HKEY_LOCAL_MACHINE, winreg.KEY_WOW64_64KEY),
+             (winreg.HKEY_CURRENT_USER, 0))
     try:
-        sl = (foo(winreg.HKEY_LOCAL_MACHINE, winreg.KEY_WOW64_32KEY) +
-              foo(winreg.HKEY_LOCAL_MACHINE, winreg.KEY_WOW64_64KEY) +
-              foo(winreg.HKEY_CURRENT_USER, 0))
-        return sl
+        # the three registry trees are independent, winreg releases the GIL while walking them
+        with ThreadPoolExecutor(max_workers=len(scans)) as executor:
+            futures = [executor.submit(foo, *scan) for scan in scans]
+            return list(chain.from_iterable(f.result() for f in futures))
     except Exception as e:
         logger.info('Exception occurred in get_software_list, exception is: {}'.format(e))
         return []
@@ -118,16 +241,23 @@ def find_installed_software(name_pattern: str):
     return final_list
 
 
+@lru_cache(256)
+def _parse_version(version: str):
+    from packaging.version import Version, InvalidVersion
+    try:
+        return Version(version)
+    except InvalidVersion:
+        return None
+
+
 def is_newer_version(min_version, current_version):
-    cur_range = current_version.split(".")
-    min_range = min_version.split(".")
-    for index in range(len(cur_range)):
-        if len(min_range) > index:
-            try:
-                return int(cur_range[index]) >= int(min_range[index])
-            except:
-                return False
-    return False
+    """
+    :return: True if current_version >= min_version, False if any of them is not a valid version
+    """
+    cur, minimum = _parse_version(current_version), _parse_version(min_version)
+    if cur is None or minimum is None:
+        return False
+    return cur >= minimum
 
 
 if __name__ == '__main__':
@@ -1,13 +1,17 @@
+import atexit
 import ipaddress
 import logging
 import os
 import socket
 import sys
 import time
-from typing import Dict, List
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, List, Tuple
 from config import config
 
 import dns.message
+import dns.name
 import dns.query
 import dns.rdatatype
 import dns.resolver
@@ -18,6 +22,7 @@ from gevent.lock import RLock
 import httpx
 
 _orig_create_connection = connection.create_connection
+_doh_installed = False
 PY3 = sys.version_info >= (3, 0)
 logger = logging.getLogger(__name__)
 
@@ -27,77 +32,96 @@ logger = logging.getLogger(__name__)
 DOH_SERVER = '223.5.5.5'
 # iQDNS https://iqiq.io/servers.html
 # DOH_SERVER = 'https://cn-east.iqiqzz.com/dns-query'
-doh_server_name = urlparse(DOH_SERVER).netloc or DOH_SERVER
+doh_server_name = sys.intern(urlparse(DOH_SERVER).netloc or DOH_SERVER)
+# hosts that are connected to directly without resolving through DoH
+_bypass_hosts = frozenset({doh_server_name, 'localhost'})
 os.environ['no_proxy'] = f'https://{doh_server_name}'
-session = httpx.Client()
-query_lock = RLock()
+# one keep-alive client for all lookups, so the TLS handshake to the DoH server is paid once
+session = httpx.Client(timeout=3.0, limits=httpx.Limits(max_keepalive_connections=4))
+atexit.register(session.close)
 
 resolver = dns.resolver.Resolver(configure=False)
 resolver.nameservers = ["223.5.5.5", '119.29.29.29']
 
 
 try_ipv6 = connection.HAS_IPV6 and not config.setting.download.disableAria2Ipv6
+HAPPY_EYEBALLS_DELAY = 0.25
+_RDTYPE_MAP = {'A': dns.rdatatype.A, 'AAAA': dns.rdatatype.AAAA}
+# host -> record type ('A' / 'AAAA') that connected last time
+preferred_record_type: Dict[str, str] = {}
 
 
-class DnsCacheItem:
-    expire_at: float = 0
-    answer = None
-
-    def __repr__(self):
-        return f'DnsCacheItem(expire_at={self.expire_at}, answer={self.answer})'
-
-    def __str__(self):
-        return self.__repr__()
-
-
-dns_cache: Dict[str, List[DnsCacheItem]] = {}
+# (name, rdtype) -> (expire_at, addresses), an empty tuple marks a failed lookup
+dns_cache: Dict[Tuple[str, int], Tuple[float, Tuple[str, ...]]] = {}
+per_key_locks: Dict[Tuple[str, int], RLock] = defaultdict(RLock)
+# the per-key locks only dedupe lookups, the shared httpx client is used by one greenlet at a time
+session_lock = RLock()
+NEGATIVE_CACHE_TTL = 30
+# expired entries are only swept once the cache grows past this size
+DNS_CACHE_PRUNE_SIZE = 256
 
 
 def is_ip_address(hostname: str):
+    # cheap shape checks first, most hostnames never reach the (raising) parser
+    if ':' in hostname:
+        parser = ipaddress.IPv6Address
+    elif hostname.count('.') == 3 and hostname.replace('.', '').isdigit():
+        parser = ipaddress.IPv4Address
+    else:
+        return False
     try:
-        ipaddress.ip_address(hostname)
+        parser(hostname)
         return True
-    except:
+    except ValueError:
         return False
 
 
-def update_dns_cache(name: str, answer):
-    item = DnsCacheItem()
-    item.expire_at = time.time() + answer.ttl
-    item.answer = answer
-    available_items = _get_available_items(name)
-    available_items.append(item)
-    # logger.debug(f'update dns cache [{name}]: {available_items}')
-    dns_cache[name] = available_items
+def update_dns_cache(key: Tuple[str, int], addresses: List[str], ttl: float):
+    now = time.monotonic()
+    if len(dns_cache) >= DNS_CACHE_PRUNE_SIZE:
+        _prune_dns_cache(now)
+    dns_cache[key] = (now + ttl, tuple(addresses))
 
 
-def _get_available_items(name: str, record_type: str = 'A'):
-    rdtype = dns.rdatatype.from_text(record_type)
-    now = time.time()
-    cached_items = dns_cache.get(name, [])
-    available_items = [item for item in cached_items if item.expire_at > now and item.answer.rdtype == rdtype]
-    return available_items
+def _prune_dns_cache(now: float):
+    for key in [k for k, item in dns_cache.items() if item[0] <= now]:
+        del dns_cache[key]
+        per_key_locks.pop(key, None)
+
+
+def take_from_dns_cache(key: Tuple[str, int]):
+    """
+    :return: cached addresses, an empty list for a cached failure or None on miss
+    """
+    item = dns_cache.get(key)
+    if item and item[0] > time.monotonic():
+        return list(item[1])
+    return None
 
 
-def take_from_dns_cache(name: str, record_type: str = 'A'):
-    res = []
-    available_items = _get_available_items(name, record_type)
-    available_answers = [item.answer for item in available_items]
-    for answer in available_answers:
-        for ip in answer:
-            res.append(ip.address)
-    return res
+@lru_cache(256)
+def _dns_name(name: str):
+    # the same few hosts are queried over and over, parse each name once
+    return dns.name.from_text(name)
 
 
 def query_address(name, record_type='A', server=DOH_SERVER, path="/dns-query", fallback=True, verbose=True):
-    query_lock.acquire()
-    try:
-        return _query_address(name, record_type, server, path, fallback, verbose)
-    finally:
-        query_lock.release()
+    if is_ip_address(name):
+        return [name]
+    rdtype = _RDTYPE_MAP.get(record_type) or dns.rdatatype.from_text(record_type)
+    key = (name, rdtype)
+    retval = take_from_dns_cache(key)
+    if retval is not None:
+        return retval
+    with per_key_locks[key]:
+        # another greenlet may have resolved it while we were waiting
+        retval = take_from_dns_cache(key)
+        if retval is not None:
+            return retval
+        return _query_address(name, key[1], server, path, fallback, verbose)
 
 
-def _query_address(name, record_type='A', server=DOH_SERVER, path="/dns-query", fallback=True, verbose=True):
+def _query_address(name, rdtype, server=DOH_SERVER, path="/dns-query", fallback=True, verbose=True):
     """
     Returns domain name query results retrieved by using DNS over HTTPS protocol
 
@@ -105,29 +129,19 @@ def _query_address(name, record_type='A', server=DOH_SERVER, path="/dns-query",
 
     >>> query_address("one.one.one.one", fallback=False)
     ['1.0.0.1', '1.1.1.1']
-    >>> query_address("one", "NS")
-    ['a.nic.one.', 'b.nic.one.', 'c.nic.one.', 'd.nic.one.']
     """
-    if is_ip_address(name):
-        return [name]
-
-    retval = take_from_dns_cache(name, record_type)
-    if retval:
-        logger.debug(f'use dns answer from cache: {retval}')
-        return retval
-
+    key = (name, rdtype)
+    retval = []
+    ttl = None
     try:
-        q = dns.message.make_query(name, dns.rdatatype.from_text(record_type))
-        resp = dns.query.https(q, server, session=session)
-        # print(f'[{name}] doh answer: {resp.answer}')
-        logger.debug(f'doh answer of [{name} in {record_type}]: {resp.answer}')
-        if not resp.answer:
-            return []
-        retval = []
+        q = dns.message.make_query(_dns_name(name), rdtype)
+        with session_lock:
+            resp = dns.query.https(q, server, session=session)
+        logger.debug(f'doh answer of [{name} in {rdtype.name}]: {resp.answer}')
         for answer in resp.answer:
-            if answer.rdtype not in {dns.rdatatype.AAAA, dns.rdatatype.A}:
+            if answer.rdtype != rdtype:
                 continue
-            update_dns_cache(name, answer)
+            ttl = answer.ttl if ttl is None else min(ttl, answer.ttl)
             for item in answer:
                 retval.append(item.address)
     except Exception as ex:
@@ -135,12 +149,20 @@ def _query_address(name, record_type='A', server=DOH_SERVER, path="/dns-query",
             logger.debug("Exception occurred: '%s'" % ex)
 
     if not retval and fallback:
-        answer: dns.resolver.Answer = resolver.resolve(name, dns.rdatatype.from_text(record_type))
-        update_dns_cache(name, answer)
-        logger.debug(f'dns resolver answer: {answer.rrset}')
-        retval = []
-        for item in answer:
-            retval.append(item.address)
+        try:
+            answer: dns.resolver.Answer = resolver.resolve(name, rdtype)
+            logger.debug(f'dns resolver answer: {answer.rrset}')
+            ttl = answer.rrset.ttl
+            for item in answer:
+                retval.append(item.address)
+        except Exception as ex:
+            if verbose:
+                logger.debug(f"dns resolver failed for [{name}]: '{ex}'")
+
+    if retval:
+        update_dns_cache(key, retval, ttl)
+    else:
+        update_dns_cache(key, retval, NEGATIVE_CACHE_TTL)
 
     if not PY3 and retval:
         retval = [_.encode() for _ in retval]
@@ -148,7 +170,6 @@ def _query_address(name, record_type='A', server=DOH_SERVER, path="/dns-query",
 
 
 def _try_connect(addresses, port, *args, **kwargs):
-    global try_ipv6
     for ip in addresses:
         try:
             sock: socket.socket = _orig_create_connection((ip, port), *args, **kwargs)
@@ -158,31 +179,73 @@ def _try_connect(addresses, port, *args, **kwargs):
             pass
 
 
+def _resolve_and_connect(host, record_type, port, args, kwargs):
+    return _try_connect(query_address(host, record_type), port, *args, **kwargs)
+
+
+def _close_result(greenlet):
+    if greenlet.value:
+        greenlet.value.close()
+
+
+def _happy_eyeballs_connect(host, port, args, kwargs):
+    """
+    Race IPv6 and IPv4 connections (RFC 8305), IPv6 gets a short head start.
+    The winning record type is remembered per host.
+    """
+    import gevent
+    g6 = gevent.spawn(_resolve_and_connect, host, 'AAAA', port, args, kwargs)
+    g6.join(timeout=HAPPY_EYEBALLS_DELAY)
+    if g6.ready() and g6.value:
+        preferred_record_type[host] = 'AAAA'
+        return g6.value
+    g4 = gevent.spawn(_resolve_and_connect, host, 'A', port, args, kwargs)
+    pending = [g6, g4]
+    while pending:
+        for g in gevent.wait(pending, count=1):
+            pending.remove(g)
+            if g.value:
+                # the loser may still connect, close its socket once it does
+                for loser in pending:
+                    loser.link_value(_close_result)
+                preferred_record_type[host] = 'AAAA' if g is g6 else 'A'
+                return g.value
+    return None
+
+
 def patched_create_connection(address, *args, **kwargs):
     """Wrap urllib3's create_connection to resolve the name elsewhere"""
     # resolve hostname to an ip address; use your own
     # resolver here, as otherwise the system resolver will be used.
-    global try_ipv6
     host, port = address
-    if host.strip() == doh_server_name:
-        return _orig_create_connection((doh_server_name, port), *args, **kwargs)
-    if try_ipv6:
-        addresses = query_address(host, 'AAAA')
-        sock = _try_connect(addresses, port, *args, **kwargs)
+    if host in _bypass_hosts or is_ip_address(host):
+        return _orig_create_connection(address, *args, **kwargs)
+    record_type = preferred_record_type.get(host)
+    if record_type:
+        sock = _resolve_and_connect(host, record_type, port, args, kwargs)
         if sock:
             return sock
-        elif addresses:
-            logger.debug(f'IPv6 disabled in DoH.')
-            try_ipv6 = False
-    addresses = query_address(host)
-    sock = _try_connect(addresses, port, *args, **kwargs)
+        # the remembered family stopped working, race again
+        preferred_record_type.pop(host, None)
+    if try_ipv6:
+        sock = _happy_eyeballs_connect(host, port, args, kwargs)
+    else:
+        sock = _resolve_and_connect(host, 'A', port, args, kwargs)
     if sock:
         return sock
     return _orig_create_connection(address, *args, **kwargs)
 
 
 def install_doh():
+    global _orig_create_connection, _doh_installed
+    if _doh_installed:
+        return
+    current = connection.create_connection
+    if current is not patched_create_connection:
+        # wrap whatever is installed now, not what was there at import time
+        _orig_create_connection = current
     connection.create_connection = patched_create_connection
+    _doh_installed = True
     # os.environ['NO_PROXY'] = DOH_SERVER
 
 
@@ -1,22 +1,24 @@
 import subprocess
 import logging
 
+from utils.ttl_cache import ttl_cache
+
 
 logger = logging.getLogger(__name__)
 
 
+@ttl_cache(seconds=10)
 def get_gpu_info():
     # https://github.com/SummaLabs/DLS/blob/master/app/backend/env/hardware.py
     gpu_info = []
     try:
-        command = "nvidia-smi --query-gpu=index,name,uuid,memory.total,memory.free," \
-                  "memory.used,count,utilization.gpu,utilization.memory --format=csv"
+        command = ['nvidia-smi', '--query-gpu=index,name,uuid,memory.total,memory.free,'
+                                 'memory.used,count,utilization.gpu,utilization.memory',
+                   '--format=csv,noheader,nounits']
         output = execute_command(command)
-        lines = output.splitlines()
-        lines.pop(0)
-        for line in lines:
-            tokens = line.split(", ")
-            if len(tokens) > 6:
+        for line in output.splitlines():
+            tokens = [t.strip() for t in line.split(',')]
+            if len(tokens) > 8:
                 gpu_info.append({'id': tokens[0], 'name': tokens[1], 'mem': tokens[3], 'cores': tokens[6],
                                  'mem_free': tokens[4], 'mem_used': tokens[5],
                                  'util_gpu': tokens[7], 'util_mem': tokens[8]})
@@ -27,8 +29,9 @@ def get_gpu_info():
 
 
 def execute_command(cmd):
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-    return process.communicate()[0].decode()
+    # don't flash a console window for the child process on windows
+    return subprocess.run(cmd, capture_output=True, text=True,
+                          creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0)).stdout
 
 
 def get_cpu_info():
@@ -36,6 +39,9 @@ def get_cpu_info():
     return platform.processor()
 
 
+_CPU_INFO_VALUES = ('Identifier', 'ProcessorNameString', 'VendorIdentifier', '~MHz')
+
+
 def get_win32_cpu_info():
     # https://github.com/pydata/numexpr/blob/master/numexpr/cpuinfo.py
     import re
@@ -62,22 +68,19 @@ def get_win32_cpu_info():
             else:
                 pnum += 1
                 info.append({"Processor": proc})
-                phnd = _winreg.OpenKey(chnd, proc)
-                pidx = 0
-                while True:
-                    try:
-                        name, value, vtpe = _winreg.EnumValue(phnd, pidx)
-                    except _winreg.error:
-                        break
-                    else:
-                        pidx = pidx + 1
-
+                with _winreg.OpenKey(chnd, proc) as phnd:
+                    # only read the values we use instead of enumerating all of them
+                    for name in _CPU_INFO_VALUES:
+                        try:
+                            value, _ = _winreg.QueryValueEx(phnd, name)
+                        except OSError:
+                            continue
                         if isinstance(value, bytes):
                             value = value.rstrip(b'\0')
                             value = auto_decode(value)
                         info[-1][name] = str(value).strip()
                         if name == "Identifier":
-                            srch = prgx.search(value)
+                            srch = prgx.search(info[-1][name])
                             if srch:
                                 info[-1]["Family"] = int(srch.group("FML"))
                                 info[-1]["Model"] = int(srch.group("MDL"))
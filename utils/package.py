@@ -1,8 +1,6 @@
 from pathlib import Path
 import logging
 
-import py7zr
-
 from exception.common_exception import IgnoredException
 from module.msg_notifier import send_notify
 import os
@@ -15,16 +13,17 @@ def uncompress(filepath: Path, target_path, delete_on_error=True,
                exception_msg='当前下载的文件看起来不太正常，请重新下载试试'):
     if isinstance(target_path, str):
         target_path = Path(target_path)
+    name = filepath.name.lower()
     try:
-        if filepath.name.lower().endswith(".zip"):
+        if name.endswith(".zip"):
             import zipfile
             with zipfile.ZipFile(filepath, 'r') as zf:
-                zf.extractall(str(target_path.absolute()))
-        elif filepath.name.lower().endswith(".7z"):
+                extract_zip(zf, target_path)
+        elif name.endswith(".7z"):
             import py7zr
             with py7zr.SevenZipFile(filepath) as zf:
                 zf.extractall(str(target_path.absolute()))
-        elif filepath.name.lower().endswith(".tar.xz"):
+        elif name.endswith(".tar.xz"):
             import tarfile
             with tarfile.open(filepath, 'r') as tf:
                 tf.extractall(str(target_path.absolute()))
@@ -36,6 +35,66 @@ def uncompress(filepath: Path, target_path, delete_on_error=True,
         raise IgnoredException(exception_msg)
 
 
+def extract_zip(zf, target_path: Path, max_workers: int = None):
+    """
+    Extract all members of an opened zipfile.ZipFile to target_path, copying with a 1MB buffer.
+    Members which would be placed outside target_path are skipped.
+    Members are extracted in parallel when the archive is backed by a file on disk, zlib releases
+    the GIL while inflating.
+    """
+    target = os.path.normpath(str(target_path.absolute()))
+    members = []
+    dirs = set()
+    for info in zf.infolist():
+        dest = os.path.normpath(os.path.join(target, info.filename))
+        if not dest.startswith(target + os.sep):
+            logger.warning(f'skip unsafe zip member: {info.filename}')
+            continue
+        if info.is_dir():
+            # keep empty directories of the archive, like extractall does
+            dirs.add(dest)
+        else:
+            dirs.add(os.path.dirname(dest))
+            members.append((info, dest))
+    for d in dirs:
+        os.makedirs(d, exist_ok=True)
+    if max_workers is None:
+        max_workers = min(8, os.cpu_count() or 1)
+    if not zf.filename or max_workers <= 1 or len(members) <= 1:
+        for info, dest in members:
+            _extract_member(zf, info, dest)
+        return
+    import threading
+    import zipfile
+    from concurrent.futures import ThreadPoolExecutor
+    # ZipFile shares one file position between readers, so every worker opens its own handle
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+
+    def extract_in_worker(member):
+        worker_zf = getattr(local, 'zf', None)
+        if worker_zf is None:
+            worker_zf = local.zf = zipfile.ZipFile(zf.filename, 'r')
+            with handles_lock:
+                handles.append(worker_zf)
+        _extract_member(worker_zf, *member)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for _ in executor.map(extract_in_worker, members):
+                pass
+    finally:
+        for handle in handles:
+            handle.close()
+
+
+def _extract_member(zf, info, dest: str):
+    import shutil
+    with zf.open(info) as src, open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst, length=1024 * 1024)
+
+
 def compress_folder(folder_path: Path, save_path):
     import py7zr
     if isinstance(save_path, str):
@@ -45,19 +104,14 @@ def compress_folder(folder_path: Path, save_path):
     try:
         logger.info(f'compress {folder_path} to {save_path}')
         zf: py7zr.SevenZipFile
-        with py7zr.SevenZipFile(save_path, 'w') as zf:
-            for dirpath, dirnames, filenames in os.walk(directory):
-                for filename in filenames:
-                    # Write the file named filename to the archive,
-                    # giving it the archive name 'arcname'.
-                    filepath = os.path.join(dirpath, filename)
-                    parentpath = os.path.relpath(filepath, directory)
-                    arcname = os.path.join(rootdir, parentpath)
-                    zf.write(filepath, arcname)
+        # preset 3 is several times faster than the default 7 with a slightly larger archive
+        with py7zr.SevenZipFile(save_path, 'w', filters=[{'id': py7zr.FILTER_LZMA2, 'preset': 3}]) as zf:
+            zf.writeall(directory, arcname=rootdir)
     except Exception as e:
         logger.error(f'Fail to compress file {folder_path} to {save_path}', exc_info=True)
         raise IgnoredException(f'备份失败, {str(e)}')
 
 
 def is_7zfile(filepath: Path):
+    import py7zr
     return py7zr.is_7zfile(filepath)
@@ -0,0 +1,33 @@
+import threading
+
+from gevent.event import AsyncResult
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key, so that only the first caller
+    runs the function and the others wait for its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = AsyncResult()
+        if not leader:
+            return call.get()
+        try:
+            res = fn(*args, **kwargs)
+            call.set(res)
+            return res
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
@@ -1,8 +1,31 @@
-import chardet
+import locale
+
+_SHORT_INPUT_SIZE = 256
 
 
 def auto_decode(input_bytes: bytes):
-    det_res = chardet.detect(input_bytes)
-    if det_res['encoding']:
-        return input_bytes.decode(det_res['encoding'])
-    return input_bytes.decode()
+    # most input is utf-8, don't pay for detection then (utf-8-sig also drops a BOM)
+    try:
+        return input_bytes.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        pass
+    if len(input_bytes) < _SHORT_INPUT_SIZE:
+        # too short for reliable detection anyway, non-utf-8 output comes from the system code page
+        try:
+            return input_bytes.decode(locale.getpreferredencoding(False))
+        except (UnicodeDecodeError, LookupError):
+            return input_bytes.decode('latin-1')
+    encoding = _detect_encoding(input_bytes)
+    if encoding:
+        return input_bytes.decode(encoding, errors='replace')
+    return input_bytes.decode(errors='replace')
+
+
+def _detect_encoding(input_bytes: bytes):
+    try:
+        from charset_normalizer import from_bytes
+    except ImportError:
+        import chardet
+        return chardet.detect(input_bytes)['encoding']
+    best = from_bytes(input_bytes).best()
+    return best.encoding if best else None
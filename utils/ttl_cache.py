@@ -0,0 +1,42 @@
+import functools
+import threading
+import time
+
+
+def ttl_cache(seconds: float = 300, should_cache=None):
+    """
+    Memoize the return value of a function for a period of time.
+    Exceptions are not cached, expired entries are replaced on next call.
+    :param seconds: time to live of the cached value
+    :param should_cache: optional predicate, return values it rejects are not cached
+    """
+    def decorator(func):
+        cache = {}
+        lock = threading.Lock()
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (args, frozenset(kwargs.items()))
+            with lock:
+                item = cache.get(key)
+            if item and item[0] > time.monotonic():
+                return item[1]
+            value = func(*args, **kwargs)
+            if should_cache is not None and not should_cache(value):
+                return value
+            with lock:
+                cache[key] = (time.monotonic() + seconds, value)
+            return value
+
+        def cache_clear():
+            with lock:
+                cache.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
+
+
+def invalidate(func):
+    """Drop all cached values of a function decorated by ttl_cache."""
+    func.cache_clear()
@@ -3,10 +3,32 @@
 import winreg
 import logging
 import os
+import time
+from functools import lru_cache
+from pathlib import Path
 
 logger = logging.getLogger(__name__)
+# touched after the runtime components are verified, skips the registry probes for a while
+runtime_ok_flag_path = Path(os.environ.get('LOCALAPPDATA', '.')).joinpath('ns-emu-tools', '.wv2ok')
+runtime_ok_flag_ttl = 7 * 86400
 
 
+def _is_runtime_ok_flag_fresh():
+    try:
+        return time.time() - runtime_ok_flag_path.stat().st_mtime < runtime_ok_flag_ttl
+    except OSError:
+        return False
+
+
+def _touch_runtime_ok_flag():
+    try:
+        runtime_ok_flag_path.parent.mkdir(parents=True, exist_ok=True)
+        runtime_ok_flag_path.touch()
+    except OSError as e:
+        logger.info(f'Fail to touch runtime flag file, msg: {str(e)}')
+
+
+@lru_cache(1)
 def get_dot_net_version():
     net_key, version = None, None
     try:
@@ -18,6 +40,20 @@ def get_dot_net_version():
     return version
 
 
+_webview2_build_versions = (
+    # runtime
+    {'key': '{F3017226-FE2A-4295-8BDF-00C3A9A7E4C5}', 'description': 'Microsoft Edge WebView2 Runtime'},
+    # beta
+    {'key': '{2CD8A007-E189-409D-A2C8-9AF4EF3C72AA}', 'description': 'Microsoft Edge WebView2 Beta'},
+    # dev
+    {'key': '{0D50BFEC-CD6A-4F9A-964C-C7416E3ACB10}', 'description': 'Microsoft Edge WebView2 Developer'},
+    # canary
+    {'key': '{65C35B14-6C1D-4122-AC46-7148CC9D6497}', 'description': 'Microsoft Edge WebView2 Canary'},
+)
+
+
+# the runtime is not removed while we are running, and the app restarts after installing it
+@lru_cache(2)
 def is_chromium(verbose=False):
     from utils.common import is_newer_version
 
@@ -28,7 +64,8 @@ def is_chromium(verbose=False):
                 path = rf'Microsoft\EdgeUpdate\Clients\{key}'
             else:
                 path = rf'WOW6432Node\Microsoft\EdgeUpdate\Clients\{key}'
-            with winreg.OpenKey(getattr(winreg, key_type), rf'SOFTWARE\{path}') as windows_key:
+            with winreg.OpenKey(getattr(winreg, key_type), rf'SOFTWARE\{path}', 0,
+                                winreg.KEY_READ | winreg.KEY_WOW64_64KEY) as windows_key:
                 build, _ = winreg.QueryValueEx(windows_key, 'pv')
                 return str(build)
         except Exception as e:
@@ -36,18 +73,7 @@ def is_chromium(verbose=False):
         return '0'
 
     try:
-        build_versions = [
-            # runtime
-            {'key': '{F3017226-FE2A-4295-8BDF-00C3A9A7E4C5}', 'description': 'Microsoft Edge WebView2 Runtime'},
-            # beta
-            {'key': '{2CD8A007-E189-409D-A2C8-9AF4EF3C72AA}', 'description': 'Microsoft Edge WebView2 Beta'},
-            # dev
-            {'key': '{0D50BFEC-CD6A-4F9A-964C-C7416E3ACB10}', 'description': 'Microsoft Edge WebView2 Developer'},
-            # canary
-            {'key': '{65C35B14-6C1D-4122-AC46-7148CC9D6497}', 'description': 'Microsoft Edge WebView2 Canary'},
-        ]
-
-        for item in build_versions:
+        for item in _webview2_build_versions:
             for key_type in ('HKEY_CURRENT_USER', 'HKEY_LOCAL_MACHINE'):
                 build = edge_build(key_type, item['key'], item['description'])
                 if is_newer_version('105.0.0.0', build):
@@ -60,28 +86,34 @@ def is_chromium(verbose=False):
     return False
 
 
+@lru_cache(1)
 def ensure_runtime_components():
-    flag = False
+    if _is_runtime_ok_flag_fresh():
+        return False
+    missing = []
     version = get_dot_net_version()
     logger.info(f'dot net version: {version}')
     if version < 394802:  # .NET 4.6.2
-        install_dot_net()
-        flag = True
+        missing.append('dot_net')
     if not is_chromium(verbose=True):
-        install_webview2()
-        flag = True
+        missing.append('webview2')
+    flag = bool(missing)
     if flag:
+        install_runtime_components(missing)
         show_msgbox('重启程序', '组件安装完成后, 请重新启动程序.', 0)
+    else:
+        _touch_runtime_ok_flag()
     return flag
 
 
 def can_use_webview():
+    if _is_runtime_ok_flag_fresh():
+        return True
     version = get_dot_net_version()
     return version >= 394802 and is_chromium()
 
 
 def show_msgbox(title, content, style):
-    import ctypes  # An included library with Python install.
     #  Styles:
     #  0 : OK
     #  1 : OK | Cancel
@@ -90,49 +122,88 @@ def show_msgbox(title, content, style):
     #  4 : Yes | No
     #  5 : Retry | Cancel
     #  6 : Cancel | Try Again | Continue
-    return ctypes.windll.user32.MessageBoxW(0, content, title, style)
+    return _get_message_box_w()(0, content, title, style)
+
+
+@lru_cache(1)
+def _get_message_box_w():
+    import ctypes
+    from ctypes import wintypes
+    message_box_w = ctypes.windll.user32.MessageBoxW
+    message_box_w.argtypes = [wintypes.HWND, wintypes.LPCWSTR, wintypes.LPCWSTR, wintypes.UINT]
+    message_box_w.restype = ctypes.c_int
+    return message_box_w
 
 
 def get_download_file_name(resp):
     if 'Content-Disposition' in resp.headers:
-        import cgi
-        value, params = cgi.parse_header(resp.headers['Content-Disposition'])
-        return params['filename']
+        # cgi is deprecated, email.message parses the same header (including filename*=)
+        from email.message import Message
+        msg = Message()
+        msg['Content-Disposition'] = resp.headers['Content-Disposition']
+        filename = msg.get_filename()
+        if filename:
+            return filename
     if resp.url.find('/'):
         return resp.url.rsplit('/', 1)[1]
     return 'index'
 
 
-def download_file(url):
+@lru_cache(1)
+def _get_download_session():
     import requests
-    resp = requests.get(url)
-    local_filename = get_download_file_name(resp)
-    with open(local_filename, 'wb') as f:
-        f.write(resp.content)
+    return requests.Session()
+
+
+def download_file(url):
+    import shutil
+    # stream to disk, the installers are too big to buffer in memory
+    with _get_download_session().get(url, stream=True, timeout=(5, 30)) as resp:
+        resp.raise_for_status()
+        local_filename = get_download_file_name(resp)
+        resp.raw.decode_content = True
+        with open(local_filename, 'wb') as f:
+            shutil.copyfileobj(resp.raw, f, length=1024 * 1024)
     logger.info(f'[{local_filename}] download success.')
     return local_filename
 
 
+runtime_components = {
+    'dot_net': ('.NET Framework', 'https://go.microsoft.com/fwlink/?LinkId=2203304'),
+    'webview2': ('Microsoft Edge WebView2', 'https://go.microsoft.com/fwlink/p/?LinkId=2124703'),
+}
+
+
+def install_runtime_components(components):
+    """
+    Ask for every missing component first, then download the installers concurrently
+    and run them one by one.
+    :param components: keys of runtime_components
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    for component in components:
+        name = runtime_components[component][0]
+        ret = show_msgbox("运行组件缺失", f"缺失 {name} 组件, 是否下载安装?", 4)
+        if ret == 7:
+            raise RuntimeError(f'缺失 {name} 组件')
+    with ThreadPoolExecutor(max_workers=len(components)) as executor:
+        futures = [(runtime_components[c][0], executor.submit(download_file, runtime_components[c][1]))
+                   for c in components]
+        # installers can't run side by side, the next download keeps going meanwhile
+        for name, future in futures:
+            fn = future.result()
+            logger.info(f'installing {name} ...')
+            os.system(fn)
+            logger.info(f'removing {name} installer.')
+            os.remove(fn)
+
+
 def install_dot_net():
-    ret = show_msgbox("运行组件缺失", "缺失 .NET Framework 组件, 是否下载安装?", 4)
-    if ret == 7:
-        raise RuntimeError('缺失 .NET Framework 组件')
-    fn = download_file('https://go.microsoft.com/fwlink/?LinkId=2203304')
-    logger.info('installing .NET Framework ...')
-    os.system(fn)
-    logger.info('removing .NET Framework installer.')
-    os.remove(fn)
+    install_runtime_components(['dot_net'])
 
 
 def install_webview2():
-    ret = show_msgbox("运行组件缺失", "缺失 Microsoft Edge WebView2 组件, 是否下载安装?", 4)
-    if ret == 7:
-        raise RuntimeError('缺失 Microsoft Edge WebView2 组件')
-    fn = download_file('https://go.microsoft.com/fwlink/p/?LinkId=2124703')
-    logger.info('installing webview2...')
-    os.system(fn)
-    logger.info('removing webview2 installer.')
-    os.remove(fn)
+    install_runtime_components(['webview2'])
 
 
 if __name__ == '__main__':